@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Benchmark BibManager on synthetic bibliographies.
+
+Each size gets a generated .bib file where a share of the entries are
+duplicates of earlier ones (new key, typos in the title, changed case,
+DOI dropped...) and some entries miss required fields. Every operation is
+timed on a fresh manager, its peak Python memory is measured in a separate
+run under tracemalloc, and duplicate detection is scored against the known
+duplicates with pairwise precision and recall.
+
+    python benchmark.py --sizes 1000 10000 -o bench.json
+    python benchmark.py --sizes 1000 10000 --baseline bench.json
+    python benchmark.py --sizes 100000 --only load_streaming find_duplicates
+
+With --baseline, operations more than --tolerance slower than in the
+baseline report are listed and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+from models import BibManager
+
+VENUES = ["Nature", "Science", "Journal of Machine Learning Research", "Physical Review Letters",
+          "IEEE Transactions on Pattern Analysis and Machine Intelligence", "Bioinformatics"]
+FIRST_NAMES = ["John", "Jane", "Wei", "Maria", "Ahmed", "Olga", "Kenji", "Lucia", "Pierre", "Aisha"]
+COMMON_WORDS = ["on", "the", "of", "a", "for", "with", "learning", "network", "model", "analysis"]
+
+
+def _typo(rng: random.Random, text: str) -> str:
+    """text with one character replaced, dropped or inserted."""
+    k = rng.randrange(len(text))
+    op = rng.random()
+    letter = rng.choice(string.ascii_lowercase)
+    if op < 1 / 3:
+        return text[:k] + letter + text[k + 1:]
+    if op < 2 / 3:
+        return text[:k] + text[k + 1:]
+    return text[:k] + letter + text[k:]
+
+
+def _render(entry: Dict) -> str:
+    fields = ''.join(f",\n  {k} = {{{v}}}" for k, v in entry.items() if k not in ('ID', 'ENTRYTYPE'))
+    return f"@{entry['ENTRYTYPE']}{{{entry['ID']}{fields}\n}}\n\n"
+
+
+def generate_bib(path: str, n: int, dup_rate: float = 0.1, typo_rate: float = 0.5,
+                 incomplete_rate: float = 0.05, seed: int = 0) -> List[int]:
+    """
+    Write n synthetic entries to path. Returns the ground truth: for every
+    entry, in file order, the position of the original it duplicates (its own
+    position for originals).
+    """
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 11)))
+                  for _ in range(max(n // 2, 2000))]
+    surnames = [w.capitalize() for w in vocabulary[:max(n // 5, 500)]]
+    entries, truth = [], []
+    for i in range(n):
+        if entries and rng.random() < dup_rate:
+            origin = truth[rng.randrange(len(entries))]
+            entry = dict(entries[origin])
+            entry['ID'] = f"dup{i}"
+            if rng.random() < typo_rate:
+                entry['title'] = _typo(rng, entry['title'])
+            if rng.random() < 0.3:
+                entry['title'] = entry['title'].upper()
+            if rng.random() < 0.5:
+                entry.pop('doi', None)
+            truth.append(origin)
+        else:
+            words = rng.choices(vocabulary, k=rng.randint(4, 10)) + rng.choices(COMMON_WORDS, k=2)
+            rng.shuffle(words)
+            authors = [f"{rng.choice(surnames)}, {rng.choice(FIRST_NAMES)}" for _ in range(rng.randint(1, 4))]
+            entry = {
+                'ENTRYTYPE': 'article',
+                'ID': f"key{i}",
+                'title': " ".join(words).capitalize(),
+                'author': " and ".join(authors),
+                'journal': rng.choice(VENUES),
+                'year': str(rng.randint(1980, 2025)),
+            }
+            if rng.random() < 0.6:
+                entry['doi'] = f"10.{rng.randint(1000, 9999)}/bench.{i}"
+            if rng.random() < incomplete_rate:
+                del entry[rng.choice(('author', 'journal', 'year'))]
+            truth.append(i)
+        entries.append(entry)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(_render(entry))
+    return truth
+
+
+def _pairs(sizes) -> int:
+    return sum(k * (k - 1) // 2 for k in sizes)
+
+
+def pair_scores(groups: List[List[int]], truth: List[int]) -> Tuple[float, float]:
+    """
+    Pairwise precision and recall of groups (lists of entry positions) against
+    the ground truth of generate_bib, counted without listing the pairs.
+    """
+    overlaps = Counter((g, truth[pos]) for g, group in enumerate(groups) for pos in group)
+    true_positives = _pairs(overlaps.values())
+    predicted = _pairs(len(group) for group in groups)
+    actual = _pairs(Counter(truth).values())
+    precision = true_positives / predicted if predicted else 1.0
+    recall = true_positives / actual if actual else 1.0
+    return precision, recall
+
+
+def _edited(path: str, work_path: str, streaming: bool) -> Callable[[], BibManager]:
+    def setup():
+        shutil.copyfile(path, work_path)
+        manager = BibManager(work_path, streaming=streaming)
+        entry = manager.get_entries()[len(manager.get_entries()) // 2]
+        manager.update_entry(entry['ID'], {'note': 'edited'})
+        return manager
+    return setup
+
+
+def _operations(path: str, workdir: str) -> List[Tuple[str, Callable, Callable]]:
+    """
+    (name, setup, run) for every benchmarked operation, setup is not timed.
+    Apart from the load operations, setups load from the parse cache so a
+    large size does not spend most of its time reparsing the file. A
+    streaming load fills it, so that --only can leave out the slow full load
+    (entries then stay unparsed until an operation reads a field the
+    streaming scan does not keep).
+    """
+    cached = lambda: BibManager(path)
+    BibManager(path, streaming=True)
+    base = os.path.splitext(os.path.basename(path))[0]
+    return [
+        ('load', lambda: None, lambda _: BibManager(path, use_cache=False)),
+        ('load_streaming', lambda: None, lambda _: BibManager(path, streaming=True, use_cache=False)),
+        ('load_cached', lambda: None, lambda _: BibManager(path)),
+        ('find_duplicates', cached, lambda m: m.find_duplicates()),
+        ('find_duplicates_batched', cached, lambda m: m.find_duplicates(batched=True)),
+        ('duplicate_groups', cached, lambda m: m.duplicate_groups()),
+        ('find_incomplete', cached, lambda m: m.find_incomplete()),
+        ('search', cached, lambda m: [m.search(m.get_entries(), q) for q in ('learn', 'year:2020', 'nature')]),
+        ('save', _edited(path, os.path.join(workdir, base + '_save.bib'), False), lambda m: m.save(incremental=False)),
+        # Incremental saves need the entry spans of a streaming load
+        ('save_incremental', _edited(path, os.path.join(workdir, base + '_incremental.bib'), True), lambda m: m.save()),
+    ]
+
+
+def _measure(setup: Callable, run: Callable, repeat: int, memory: bool) -> Dict:
+    times, result = [], None
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        result = run(state)
+        times.append(time.perf_counter() - start)
+        del state
+    record = {'seconds': min(times), 'median_seconds': sorted(times)[len(times) // 2]}
+    if memory:
+        state = setup()
+        tracemalloc.start()
+        run(state)
+        record['peak_mib'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+        tracemalloc.stop()
+    record['result'] = result
+    return record
+
+
+def bench_size(n: int, workdir: str, repeat: int = 3, memory: bool = True,
+               operations: List[str] = None, **gen) -> List[Dict]:
+    path = os.path.join(workdir, f"bench_{n}.bib")
+    truth = generate_bib(path, n, **gen)
+    results = []
+    for name, setup, run in _operations(path, workdir):
+        if operations and name not in operations:
+            continue
+        record = _measure(setup, run, repeat, memory)
+        result = record.pop('result')
+        record = {'entries': n, 'operation': name, **record}
+        if name.startswith(('find_duplicates', 'duplicate_groups')):
+            groups, _ = result
+            # Generated IDs are unique, so they give back file positions
+            position = {f"key{i}": i for i in range(n)}
+            position.update({f"dup{i}": i for i in range(n)})
+            groups = [[position[e['ID']] for e in group] for group in groups]
+            record['groups'] = len(groups)
+            record['precision'], record['recall'] = (round(s, 4) for s in pair_scores(groups, truth))
+        elif name == 'find_incomplete':
+            record['incomplete'] = len(result)
+        results.append(record)
+        print(f"{n:>8} {name:<24} {record['seconds']:8.3f}s"
+              + (f" {record['peak_mib']:8.1f} MiB" if memory else "")
+              + (f"  P={record['precision']:.3f} R={record['recall']:.3f}" if 'precision' in record else ""),
+              file=sys.stderr)
+    return results
+
+
+def regressions(results: List[Dict], baseline: Dict, tolerance: float) -> List[str]:
+    """Operations more than tolerance (a fraction) slower than in baseline."""
+    before = {(r['entries'], r['operation']): r['seconds'] for r in baseline['results']}
+    slower = []
+    for r in results:
+        old = before.get((r['entries'], r['operation']))
+        if old and r['seconds'] > old * (1 + tolerance):
+            slower.append(f"{r['operation']} ({r['entries']} entries): {old:.3f}s -> {r['seconds']:.3f}s")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BibManager on synthetic bibliographies.")
+    parser.add_argument("--sizes", "-n", type=int, nargs="+", default=[1000, 10000],
+                        help="Number of entries of each generated file (default: 1000 10000)")
+    parser.add_argument("--dup-rate", type=float, default=0.1, help="Share of entries duplicating an earlier one (default: 0.1)")
+    parser.add_argument("--typo-rate", type=float, default=0.5, help="Share of duplicates with a typo in the title (default: 0.5)")
+    parser.add_argument("--incomplete-rate", type=float, default=0.05, help="Share of entries missing a field (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Timed runs per operation, the best is kept (default: 3)")
+    parser.add_argument("--only", nargs="+", metavar="OPERATION", help="Run only these operations (e.g. skip the slow full load at 100k)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of each operation")
+    parser.add_argument("--output", "-o", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", "-b", help="Earlier JSON report to compare the timings with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Slowdown over the baseline reported as a regression (default: 0.25)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bib_bench_")
+    # Keep the parse cache of the generated files away from the user's one
+    os.environ['XDG_CACHE_HOME'] = os.path.join(workdir, 'cache')
+    try:
+        results = []
+        for n in args.sizes:
+            results.extend(bench_size(n, workdir, args.repeat, not args.no_memory, args.only, dup_rate=args.dup_rate,
+                                      typo_rate=args.typo_rate, incomplete_rate=args.incomplete_rate, seed=args.seed))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {k: getattr(args, k) for k in ('dup_rate', 'typo_rate', 'incomplete_rate', 'seed', 'repeat')},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f"Regression: {line}", file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""
+Virtual table for the bibliography list.
+
+DataTable builds, measures and stores a row object for every entry, which
+is what made filtering a large file slow. BibTable only keeps the list of
+row keys: the cells of a row are asked from a callback when the row is
+drawn and cached while the row stays in the table, so showing a new filter
+result is a list swap and a repaint of the visible lines.
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from rich.text import Text
+from textual import events
+from textual.binding import Binding
+from textual.geometry import Size
+from textual.message import Message
+from textual.reactive import reactive
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+Cell = Union[str, Text]
+
+# Width given to the column that takes the remaining space, when there is none
+MIN_FILL_WIDTH = 20
+
+
+class BibTable(ScrollView, can_focus=True):
+    BINDINGS = [
+        Binding("enter", "select_cursor", "Select", show=False),
+        Binding("up", "cursor_up", "Cursor up", show=False),
+        Binding("down", "cursor_down", "Cursor down", show=False),
+        Binding("pageup", "page_up", "Page up", show=False),
+        Binding("pagedown", "page_down", "Page down", show=False),
+        Binding("home", "first_row", "First row", show=False),
+        Binding("end", "last_row", "Last row", show=False),
+    ]
+
+    COMPONENT_CLASSES = {"bib-table--header", "bib-table--cursor"}
+
+    DEFAULT_CSS = """
+    BibTable {
+        background: $surface;
+        color: $foreground;
+        & > .bib-table--header {
+            text-style: bold;
+            background: $panel;
+        }
+        & > .bib-table--cursor {
+            background: $block-cursor-blurred-background;
+        }
+        &:focus > .bib-table--cursor {
+            background: $block-cursor-background;
+            color: $block-cursor-foreground;
+            text-style: $block-cursor-text-style;
+        }
+    }
+    """
+
+    cursor_row = reactive(0)
+
+    class RowSelected(Message):
+        """Posted when a row is chosen with enter or a second click."""
+        def __init__(self, table: "BibTable", row_key: str):
+            super().__init__()
+            self.table = table
+            self.row_key = row_key
+
+        @property
+        def control(self) -> "BibTable":
+            return self.table
+
+    def __init__(self, columns: Sequence[Tuple[str, int]], get_cells: Callable[[str], Sequence[Cell]],
+                 *, name: Optional[str] = None, id: Optional[str] = None, classes: Optional[str] = None):
+        """
+        columns are (label, width) pairs, a width of 0 takes the space left.
+        get_cells(row_key) returns the cells of a row, one per column.
+        """
+        super().__init__(name=name, id=id, classes=classes)
+        self.columns = list(columns)
+        self.get_cells = get_cells
+        self.row_keys: List[str] = []
+        self._cells: Dict[str, List[Text]] = {} # row key -> cells, for rows drawn so far
+
+    @property
+    def row_count(self) -> int:
+        return len(self.row_keys)
+
+    @property
+    def cursor_key(self) -> Optional[str]:
+        return self.row_keys[self.cursor_row] if self.row_keys else None
+
+    def set_rows(self, row_keys: List[str]) -> None:
+        """
+        Show row_keys (in this order). Cached cells of the rows that stay are
+        reused and the cursor follows its row when it is still there.
+        """
+        if row_keys != self.row_keys:
+            cursor_key = self.cursor_key
+            keep = set(row_keys)
+            self._cells = {k: v for k, v in self._cells.items() if k in keep}
+            self.row_keys = list(row_keys)
+            self._update_size()
+            if cursor_key in keep:
+                self.cursor_row = self.row_keys.index(cursor_key)
+            else:
+                self.cursor_row = min(self.cursor_row, max(len(self.row_keys) - 1, 0))
+        self.refresh()
+
+    def append_rows(self, row_keys: List[str]) -> None:
+        self.row_keys.extend(row_keys)
+        self._update_size()
+        self.refresh()
+
+    def clear(self) -> None:
+        self.set_rows([])
+
+    def invalidate(self, row_keys: Optional[List[str]] = None) -> None:
+        """Forget the cells of row_keys (all rows by default), e.g. after edits."""
+        if row_keys is None:
+            self._cells = {}
+        else:
+            for key in row_keys:
+                self._cells.pop(key, None)
+        self.refresh()
+
+    def _column_widths(self) -> List[int]:
+        fixed = sum(w + 1 for _, w in self.columns if w)
+        fill = max(self.size.width - fixed - 1, MIN_FILL_WIDTH)
+        return [w or fill for _, w in self.columns]
+
+    def _update_size(self) -> None:
+        width = sum(w + 1 for w in self._column_widths())
+        self.virtual_size = Size(width, len(self.row_keys) + 1) # + header
+
+    def on_resize(self, event: events.Resize) -> None:
+        self._update_size()
+
+    def _row_cells(self, key: str) -> List[Text]:
+        cells = self._cells.get(key)
+        if cells is None:
+            cells = [
+                Text(c.replace('\n', ' '), no_wrap=True) if isinstance(c, str) else c
+                for c in self.get_cells(key)
+            ]
+            self._cells[key] = cells
+        return cells
+
+    def _render_cells(self, cells: Sequence[Text]) -> Strip:
+        line = Text(no_wrap=True, end='')
+        for cell, width in zip(cells, self._column_widths()):
+            cell = cell.copy()
+            cell.truncate(width, pad=True)
+            line.append_text(cell)
+            line.append(' ')
+        return Strip(list(line.render(self.app.console)))
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        width = self.size.width
+        if y == 0:
+            style = self.get_component_rich_style("bib-table--header")
+            strip = self._render_cells([Text(label) for label, _ in self.columns])
+            return strip.apply_style(style).crop_extend(scroll_x, scroll_x + width, style)
+
+        row = scroll_y + y - 1
+        if row >= len(self.row_keys):
+            return Strip.blank(width, self.rich_style)
+        style = self.rich_style
+        if row == self.cursor_row:
+            style += self.get_component_rich_style("bib-table--cursor")
+        strip = self._render_cells(self._row_cells(self.row_keys[row]))
+        strip = strip.apply_style(style).apply_meta({"row": row})
+        return strip.crop_extend(scroll_x, scroll_x + width, style)
+
+    def watch_cursor_row(self, old: int, new: int) -> None:
+        # Keep the cursor between the header and the bottom edge
+        visible = max(self.size.height - 1, 1)
+        if new < self.scroll_offset.y:
+            self.scroll_to(y=new, animate=False)
+        elif new >= self.scroll_offset.y + visible:
+            self.scroll_to(y=new - visible + 1, animate=False)
+        self.refresh()
+
+    def _move_cursor(self, delta: int) -> None:
+        if self.row_keys:
+            self.cursor_row = min(max(self.cursor_row + delta, 0), len(self.row_keys) - 1)
+
+    def action_cursor_up(self) -> None:
+        self._move_cursor(-1)
+
+    def action_cursor_down(self) -> None:
+        self._move_cursor(1)
+
+    def action_page_up(self) -> None:
+        self._move_cursor(-max(self.size.height - 1, 1))
+
+    def action_page_down(self) -> None:
+        self._move_cursor(max(self.size.height - 1, 1))
+
+    def action_first_row(self) -> None:
+        self._move_cursor(-len(self.row_keys))
+
+    def action_last_row(self) -> None:
+        self._move_cursor(len(self.row_keys))
+
+    def action_select_cursor(self) -> None:
+        if self.row_keys:
+            self.post_message(self.RowSelected(self, self.cursor_key))
+
+    def on_click(self, event: events.Click) -> None:
+        row = event.style.meta.get("row")
+        if row is None or row >= len(self.row_keys):
+            return
+        if row == self.cursor_row:
+            self.action_select_cursor()
+        else:
+            self.cursor_row = row
@@ -0,0 +1,66 @@
+"""
+On-disk cache of loaded bibliographies.
+
+One pickle per .bib file under $XDG_CACHE_HOME/manage_bibtex, holding what
+BibManager needs to skip parsing: the entries (parsed, or as the header of a
+lazy entry), @string/@preamble/comments, entry spans and the normalized
+fields used by duplicate detection. A cache is used only if the file still
+has the same size and either the same mtime or the same content hash.
+"""
+import hashlib
+import os
+import pickle
+from typing import Dict, Optional
+
+# Bump when the payload layout changes
+CACHE_VERSION = 5
+
+
+def cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'manage_bibtex')
+
+
+def cache_path(bib_path: str) -> str:
+    key = hashlib.sha1(os.path.abspath(bib_path).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir(), key + '.pickle')
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_cache(bib_path: str) -> Optional[Dict]:
+    """The cached payload for bib_path, or None if missing or stale."""
+    try:
+        st = os.stat(bib_path)
+        with open(cache_path(bib_path), 'rb') as f:
+            payload = pickle.load(f)
+        if payload.get('version') != CACHE_VERSION or payload['size'] != st.st_size:
+            return None
+        if payload['mtime_ns'] != st.st_mtime_ns and payload['digest'] != file_digest(bib_path):
+            return None
+        return payload
+    except Exception:
+        # Missing, unreadable or from an incompatible version: just reparse
+        return None
+
+
+def store_cache(bib_path: str, payload: Dict):
+    """Save payload for bib_path as it is on disk now. Failures are ignored."""
+    try:
+        st = os.stat(bib_path)
+        payload = dict(payload, version=CACHE_VERSION, size=st.st_size,
+                       mtime_ns=st.st_mtime_ns, digest=file_digest(bib_path))
+        path = cache_path(bib_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except (OSError, pickle.PicklingError):
+        pass
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Merge several .bib files into one, dropping duplicates across (and within)
+files with the same rules as BibManager.find_duplicates.
+
+Files are parsed in a process pool, then combined in the order given. Each
+group of duplicates is merged into one entry (by default the first one,
+completed with the fields only the others have, see --precedence). A JSON
+provenance report records which file every kept entry came from, what was
+merged into it and where its other field values came from.
+
+    python merge_bib.py alice.bib bob.bib carol.bib -o group.bib
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+from bibtexparser.bibdatabase import BibDatabase
+
+from models import DEFAULT_PRECEDENCE, MERGE_PRECEDENCE, BibManager
+
+
+def load_file(path: str, use_cache: bool = True) -> Dict:
+    """Parse one file (in a worker process) into plain, picklable parts."""
+    manager = BibManager(path, use_cache=use_cache)
+    db = manager.db
+    return {
+        'entries': [dict(e) for e in manager.get_entries()],
+        'strings': dict(db.strings),
+        'preambles': list(db.preambles),
+        'comments': list(db.comments),
+    }
+
+
+def combine(paths: List[str], parts: List[Dict]) -> Tuple[BibDatabase, List[str]]:
+    """One database with every file's content, and the source file of each entry."""
+    db = BibDatabase()
+    sources = []
+    for path, part in zip(paths, parts):
+        db.entries.extend(part['entries'])
+        sources.extend([path] * len(part['entries']))
+        for name, value in part['strings'].items():
+            # First definition wins, like a later @string in the same file
+            if name not in db.strings:
+                db.strings[name] = value
+        db.preambles.extend(p for p in part['preambles'] if p not in db.preambles)
+        db.comments.extend(part['comments'])
+    return db, sources
+
+
+def merge_files(paths: List[str], output: str, threshold: float = 85.0, jobs: int = None,
+                use_cache: bool = True, precedence: str = DEFAULT_PRECEDENCE) -> Tuple[BibManager, Dict]:
+    """
+    Load paths in parallel, merge duplicates and return a BibManager for output
+    holding the merged database (not yet saved) along with the provenance report.
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parts = list(pool.map(load_file, paths, [use_cache] * len(paths)))
+    db, sources = combine(paths, parts)
+
+    manager = BibManager(output, autoload=False)
+    manager.load_database(db)
+    source_of = {id(e): src for e, src in zip(db.entries, sources)}
+    groups, _ = manager.find_duplicates(threshold=threshold)
+
+    # Entries can share an ID across files, so provenance goes by identity
+    merges = {}
+    for group in groups:
+        merge = manager.merge_group(group, precedence, threshold=threshold)
+        kept = next(e for e in group if manager.is_live(e))
+        others = [e for e in group if e is not kept]
+        merges[id(kept)] = {
+            'merged': [{'ID': e.get('ID'), 'source': source_of[id(e)], 'reason': reason}
+                       for e, reason in zip(others, merge.reasons)],
+            'fields': list(merge.fields),
+        }
+
+    records = []
+    for e in manager.get_entries():
+        record = {'ID': e.get('ID'), 'source': source_of[id(e)]}
+        record.update(merges.get(id(e), {}))
+        records.append(record)
+    report = {
+        'inputs': [{'path': path, 'entries': len(part['entries'])} for path, part in zip(paths, parts)],
+        'output': output,
+        'threshold': threshold,
+        'precedence': precedence,
+        'entries': records,
+    }
+    return manager, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge .bib files, dropping duplicates across files.")
+    parser.add_argument("inputs", nargs="+", help="Input .bib files, in order of preference")
+    parser.add_argument("--output", "-o", required=True, help="Merged .bib file to write")
+    parser.add_argument("--report", "-r", help="Provenance report (default: <output>.provenance.json)")
+    parser.add_argument("--threshold", "-t", type=float, default=85.0, help="Title similarity for fuzzy duplicates (default: 85)")
+    parser.add_argument("--precedence", "-p", choices=MERGE_PRECEDENCE, default=DEFAULT_PRECEDENCE,
+                        help=f"Which duplicate is kept and whose values win (default: {DEFAULT_PRECEDENCE}, in input order)")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Parser processes (default: one per CPU)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the parse cache")
+    args = parser.parse_args()
+
+    missing = [p for p in args.inputs if not os.path.isfile(p)]
+    if missing:
+        print(f"Error: not found: {', '.join(missing)}", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    manager, report = merge_files(args.inputs, args.output, args.threshold, args.jobs,
+                                  not args.no_cache, args.precedence)
+    manager.save()
+    report_path = args.report or args.output + '.provenance.json'
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    total = sum(i['entries'] for i in report['inputs'])
+    kept = len(report['entries'])
+    print(f"Merged {total} entries from {len(args.inputs)} files into {kept} "
+          f"({total - kept} duplicates folded in) in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    print(f"Wrote {args.output} and {report_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
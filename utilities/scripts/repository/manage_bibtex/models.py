@@ -2,155 +2,1161 @@ import bibtexparser
 from bibtexparser.bparser import BibTexParser
 from bibtexparser.bwriter import BibTexWriter
 from bibtexparser.bibdatabase import BibDatabase
-from rapidfuzz import fuzz, utils
+from rapidfuzz import fuzz, process, utils
+import numpy as np
+import os
 import re
-from typing import List, Dict, Tuple, Set
+import shutil
+from collections import Counter, defaultdict
+from typing import List, Dict, Tuple, Set, NamedTuple, Callable, Iterable, Iterator, Optional
+from bisect import bisect_left, bisect_right, insort
+from itertools import repeat
+
+from cache import load_cache, store_cache
+from records import compact_entry
+from streaming import BibStream, LazyEntry
+
+
+# --- Validation ---
+
+# What find_incomplete checks, by ENTRYTYPE ('*' applies to every type):
+#   required: fields that must be filled in
+#   one_of:   groups of fields of which at least one must be filled in
+#   formats:  regular expression a filled in field must match (case-insensitive)
+VALIDATION_RULES = {
+    '*': {
+        'required': ('title', 'year'),
+        'formats': {'year': r'\d{4}[a-z]?', 'doi': r'10\.\d{4,9}/\S+'},
+    },
+    'article': {'one_of': (('author', 'editor'),), 'required': ('journal',)},
+    'inproceedings': {'one_of': (('author', 'editor'),), 'required': ('booktitle',)},
+    'incollection': {'one_of': (('author', 'editor'),), 'required': ('booktitle',)},
+    'book': {'one_of': (('author', 'editor'),)},
+}
+
+
+def _filled(value) -> bool:
+    return bool(str(value).strip())
+
+
+def _compile_checker(rules: List[Dict]) -> Callable[[Dict], Tuple[str, ...]]:
+    """
+    One function checking an entry against all of rules, which returns the
+    issues found. A valid entry gets the shared empty tuple.
+    """
+    required = tuple((field, f"missing {field}") for r in rules for field in r.get('required', ()))
+    one_of = tuple((group, f"missing {'/'.join(group)}") for r in rules for group in r.get('one_of', ()))
+    formats = tuple(
+        (field, re.compile(pattern, re.IGNORECASE).fullmatch, f"malformed {field}")
+        for r in rules for field, pattern in r.get('formats', {}).items()
+    )
+
+    def check(entry: Dict) -> Tuple[str, ...]:
+        issues = ()
+        get = entry.get
+        for field, issue in required:
+            if not _filled(get(field, '')):
+                issues += (issue,)
+        for group, issue in one_of:
+            for field in group:
+                if _filled(get(field, '')):
+                    break
+            else:
+                issues += (issue,)
+        for field, match, issue in formats:
+            value = str(get(field, '')).strip()
+            if value and not match(value):
+                issues += (issue,)
+        return issues
+
+    return check
+
+
+_DEFAULT_CHECKER = _compile_checker([VALIDATION_RULES['*']])
+_CHECKERS = {
+    entry_type: _compile_checker([VALIDATION_RULES['*'], rules])
+    for entry_type, rules in VALIDATION_RULES.items() if entry_type != '*'
+}
+
+
+def entry_issues(entry: Dict) -> Tuple[str, ...]:
+    """Every VALIDATION_RULES rule the entry breaks, e.g. ('missing year',)."""
+    return _CHECKERS.get(entry.get('ENTRYTYPE', '').lower(), _DEFAULT_CHECKER)(entry)
+
+
+class EntryIssues(NamedTuple):
+    """An entry reported by find_incomplete."""
+    ID: str
+    issues: Tuple[str, ...]
+    entry: Dict # IDs are not unique in a file being cleaned up
+
+
+# --- Duplicate detection helpers ---
+
+# Fuzzy blocking: every titled entry is indexed under its rarest title words, and
+# entries adjacent in sorted-title order (forwards and reversed) are compared too,
+# so typos in either end of a title still land in a shared block.
+BLOCK_WORDS_PER_ENTRY = 4
+SORTED_NEIGHBOURHOOD_WINDOW = 4
+
+# Batched mode: number of title rows scored per process.cdist call
+BATCH_ROWS = 256
+
+# Fuzzy matches also need this author similarity (token_sort_ratio)
+AUTHOR_THRESHOLD = 70.0
+
+# DuplicateIndex keeps fuzzy pairs scoring at least this title similarity, so
+# thresholds down to it can be answered without rescoring
+PAIR_SCORE_FLOOR = 50.0
+
+
+class EntryFeatures(NamedTuple):
+    """Normalized fields of one entry, cached by BibManager between edits."""
+    id_lower: str
+    title: str
+    author: str
+    doi: str
+    url: str
+
+
+def _entry_features(entry: Dict) -> EntryFeatures:
+    return EntryFeatures(
+        id_lower=entry.get('ID', '').lower(),
+        title=utils.default_process(entry.get('title', '')),
+        author=utils.default_process(entry.get('author', '')),
+        doi=entry.get('doi', '').strip().lower(),
+        url=entry.get('url', '').strip().lower(),
+    )
+
+
+def _hard_reason(f1: EntryFeatures, f2: EntryFeatures) -> str:
+    """Return the identifier shared by both entries, or an empty string."""
+    if f1.id_lower == f2.id_lower:
+        return "Same BibTeX ID"
+    if f1.doi and f2.doi and f1.doi == f2.doi:
+        return f"Same DOI ({f1.doi})"
+    if f1.url and f2.url and f1.url == f2.url:
+        return "Same URL"
+    if f1.title and f2.title and f1.title == f2.title:
+        return "Exact Title Match"
+    return ""
+
+
+def _fuzzy_scores(f1: EntryFeatures, f2: EntryFeatures) -> Tuple[float, float]:
+    title_sim = fuzz.ratio(f1.title, f2.title) if f1.title and f2.title else 0.0
+    author_sim = fuzz.token_sort_ratio(f1.author, f2.author) if f1.author and f2.author else 100.0
+    return title_sim, author_sim
+
+
+def _fuzzy_reason(title_sim: float, author_sim: float) -> str:
+    return f"Fuzzy Match (Title: {title_sim:.0f}%, Author: {author_sim:.0f}%)"
+
+
+def _match_reason(f1: EntryFeatures, f2: EntryFeatures, threshold: float) -> str:
+    """Return why f2 duplicates f1, or an empty string if it does not."""
+    # 1. Hard Matches (Fast & Certain)
+    reason = _hard_reason(f1, f2)
+    if reason:
+        return reason
+
+    # 2. Fuzzy Match Fallback
+    title_sim, author_sim = _fuzzy_scores(f1, f2)
+    if title_sim >= threshold and author_sim >= AUTHOR_THRESHOLD:
+        return _fuzzy_reason(title_sim, author_sim)
+    return ""
+
+
+def _greedy_groups(entries: List[Dict], candidates_of: Callable[[int], Iterable[int]],
+                   reason_of: Callable[[int, int], str]) -> Tuple[List[List[Dict]], Dict[str, str]]:
+    """
+    Group entries the way find_duplicates always has: each entry not yet
+    grouped becomes a base and collects every later, ungrouped entry that
+    matches it (entries are considered grouped by BibTeX ID).
+    candidates_of(i) gives the sorted positions j > i that may match entry i,
+    reason_of(i, j) why they match, or an empty string.
+    """
+    duplicates_groups = []
+    reasons = {} # Maps ID -> Explainability string
+    visited_ids = set()
+    
+    for i, entry1 in enumerate(entries):
+        entry_id1 = entry1.get('ID')
+        if entry_id1 in visited_ids:
+            continue
+            
+        current_group = [entry1]
+        
+        for j in candidates_of(i):
+            entry2 = entries[j]
+            entry_id2 = entry2.get('ID')
+            if entry_id2 in visited_ids:
+                continue
+                
+            match_reason = reason_of(i, j)
+            if match_reason:
+                current_group.append(entry2)
+                visited_ids.add(entry_id2)
+                reasons[entry_id2] = match_reason
+                
+        if len(current_group) > 1:
+            duplicates_groups.append(current_group)
+            visited_ids.add(entry_id1)
+            reasons[entry_id1] = "Base Entry (Matched against this)"
+            
+    return duplicates_groups, reasons
+
+
+def _hard_keys(f: EntryFeatures) -> List[Tuple[str, str]]:
+    """Hash keys under which an entry can be hard-matched."""
+    keys = [('id', f.id_lower)]
+    if f.doi:
+        keys.append(('doi', f.doi))
+    if f.url:
+        keys.append(('url', f.url))
+    if f.title:
+        keys.append(('title', f.title))
+    return keys
+
+
+def _hard_buckets(features: List[EntryFeatures]) -> Dict[Tuple[str, str], List[int]]:
+    buckets = defaultdict(list)  # (field, value) -> positions
+    for pos, f in enumerate(features):
+        for key in _hard_keys(f):
+            buckets[key].append(pos)
+    return buckets
+
+
+def _candidate_index(features: List[EntryFeatures]) -> Callable[[int], List[int]]:
+    """
+    Build the lookup tables for find_duplicates and return a function giving,
+    for position i, the sorted positions j > i worth comparing against it.
+    Hard identifiers are exact, the title blocks are a heuristic.
+    """
+    buckets = _hard_buckets(features)
+
+    # Title words: each entry picks its rarest shared words as block keys (a word
+    # seen in a single title cannot pair it with anything). Two entries are
+    # candidates when one's keys appear anywhere in the other's title, which
+    # keeps the blocking symmetric even when they picked different keys.
+    titled = [pos for pos, f in enumerate(features) if f.title]
+    words = {pos: set(features[pos].title.split()) for pos in titled}
+    doc_freq = Counter(w for ws in words.values() for w in ws)
+    block_keys = {}
+    for pos, ws in words.items():
+        shared = [w for w in ws if doc_freq[w] > 1]
+        block_keys[pos] = sorted(shared, key=lambda w: (doc_freq[w], w))[:BLOCK_WORDS_PER_ENTRY]
+        for w in ws:
+            buckets[('word', w)].append(pos)
+        for w in block_keys[pos]:
+            buckets[('key', w)].append(pos)
+
+    # Sorted neighbourhood on the title and on the reversed title
+    neighbours = defaultdict(set)
+    for sort_key in (lambda p: features[p].title, lambda p: features[p].title[::-1]):
+        ordered = sorted(titled, key=sort_key)
+        for k, pos in enumerate(ordered):
+            for other in ordered[k + 1:k + 1 + SORTED_NEIGHBOURHOOD_WINDOW]:
+                neighbours[pos].add(other)
+                neighbours[other].add(pos)
+
+    def candidates_of(i: int) -> List[int]:
+        f = features[i]
+        found = set()
+        for key in _hard_keys(f):
+            found.update(buckets[key])
+        if f.title:
+            for w in block_keys[i]:
+                found.update(buckets[('word', w)])
+            for w in words[i]:
+                found.update(buckets.get(('key', w), ()))
+            found.update(neighbours[i])
+        return sorted(j for j in found if j > i)
+
+    return candidates_of
+
+
+def _batched_candidates(features: List[EntryFeatures], threshold: float) -> Callable[[int], List[int]]:
+    """
+    Same contract as `_candidate_index`, but the fuzzy candidates come from
+    scoring every title against every later title with `process.cdist`.
+    Rows are scored BATCH_ROWS at a time into a NumPy matrix (multi-threaded,
+    below-threshold scores zeroed by score_cutoff), so nothing is lost to blocking.
+    Every pair of titles is still scored: exact, but slower than blocking on
+    large files (see BibManager.find_duplicates).
+    """
+    buckets = _hard_buckets(features)
+    titled = np.array([pos for pos, f in enumerate(features) if f.title], dtype=np.intp)
+    titles = [features[pos].title for pos in titled]
+    rank = {pos: k for k, pos in enumerate(titled.tolist())}
+    block_start, block_scores = None, None
+
+    def title_matches(k: int) -> List[int]:
+        nonlocal block_start, block_scores
+        start = k - k % BATCH_ROWS
+        if block_start != start:
+            block_start = start
+            block_scores = process.cdist(
+                titles[start:start + BATCH_ROWS], titles[start:],
+                scorer=fuzz.ratio, score_cutoff=threshold,
+                dtype=np.float32, workers=-1,
+            )
+        row = block_scores[k - start, k - start + 1:]
+        return titled[np.flatnonzero(row) + k + 1].tolist()
+
+    def candidates_of(i: int) -> List[int]:
+        found = set()
+        for key in _hard_keys(features[i]):
+            found.update(buckets[key])
+        if i in rank:
+            found.update(title_matches(rank[i]))
+        return sorted(j for j in found if j > i)
+
+    return candidates_of
+
+
+class DuplicateIndex:
+    """
+    Pair scores behind BibManager.duplicate_groups. Hard-identifier pairs keep
+    their reason, fuzzy pairs their (title, author) similarity when the title
+    scores at least PAIR_SCORE_FLOOR and the author passes AUTHOR_THRESHOLD.
+    Pairs are keyed by entry identity so deletions do not shift them.
+    """
+    def __init__(self, manager: 'BibManager'):
+        self.manager = manager
+        self.stale = set()  # ids of entries edited since they were scored
+        self._score_all()
+
+    def _score_all(self):
+        self.known = {}  # id(entry) -> entry
+        self.keys = {}  # id(entry) -> hard keys it was bucketed under
+        self.buckets = defaultdict(set)  # hard key -> ids of entries
+        self.hard = defaultdict(dict)  # id -> {other id: reason}
+        self.fuzzy = defaultdict(dict)  # id -> {other id: (title_sim, author_sim)}
+        self._ranked = None  # fuzzy pairs as (-title_sim, id, other id), best first
+        self.stale.clear()
+
+        entries = self.manager.get_entries()
+        features = [self.manager.features(e) for e in entries]
+        for entry, f in zip(entries, features):
+            self.known[id(entry)] = entry
+            self.keys[id(entry)] = _hard_keys(f)
+            for key in self.keys[id(entry)]:
+                self.buckets[key].add(id(entry))
+        for members in self.buckets.values():
+            for a in members:
+                for b in members:
+                    if a != b and b not in self.hard[a]:
+                        self._add_hard(a, b)
+
+        titled = [k for k, f in enumerate(features) if f.title]
+        titles = [features[k].title for k in titled]
+        for start in range(0, len(titled), BATCH_ROWS):
+            scores = process.cdist(
+                titles[start:start + BATCH_ROWS], titles[start:],
+                scorer=fuzz.ratio, score_cutoff=PAIR_SCORE_FLOOR,
+                dtype=np.float32, workers=-1,
+            )
+            for row, col in zip(*np.nonzero(np.triu(scores, 1))):
+                self._add_fuzzy(entries[titled[start + row]], entries[titled[start + col]])
+
+    def _add_hard(self, a: int, b: int):
+        f1, f2 = self.manager.features(self.known[a]), self.manager.features(self.known[b])
+        reason = _hard_reason(f1, f2)
+        self.hard[a][b] = self.hard[b][a] = reason
+
+    def _add_fuzzy(self, e1: Dict, e2: Dict):
+        if id(e2) in self.hard[id(e1)]:
+            return
+        title_sim, author_sim = _fuzzy_scores(self.manager.features(e1), self.manager.features(e2))
+        if title_sim >= PAIR_SCORE_FLOOR and author_sim >= AUTHOR_THRESHOLD:
+            self.fuzzy[id(e1)][id(e2)] = self.fuzzy[id(e2)][id(e1)] = (title_sim, author_sim)
+            self._ranked = None
+
+    def invalidate(self, entry: Dict):
+        """Mark an entry as edited or deleted; it is rescored on the next query."""
+        self.stale.add(id(entry))
+
+    def _remove(self, key: int):
+        del self.known[key]
+        for bucket_key in self.keys.pop(key):
+            self.buckets[bucket_key].discard(key)
+        for other in self.hard.pop(key, {}):
+            del self.hard[other][key]
+        for other in self.fuzzy.pop(key, {}):
+            del self.fuzzy[other][key]
+        self._ranked = None
+
+    def _add(self, entry: Dict):
+        key = id(entry)
+        self.known[key] = entry
+        f = self.manager.features(entry)
+        self.keys[key] = _hard_keys(f)
+        for bucket_key in self.keys[key]:
+            members = self.buckets[bucket_key]
+            for other in members:
+                if other not in self.hard[key]:
+                    self._add_hard(key, other)
+            members.add(key)
+        if f.title:
+            choices = {other: self.manager.features(e).title for other, e in self.known.items() if other != key}
+            for _, _, other in process.extract(f.title, choices, scorer=fuzz.ratio,
+                                               score_cutoff=PAIR_SCORE_FLOOR, limit=None):
+                self._add_fuzzy(entry, self.known[other])
+
+    def _sync(self, entries: List[Dict]):
+        current = {id(e): e for e in entries}
+        gone = [k for k in self.known if k not in current or k in self.stale]
+        new = len(current) - (len(self.known) - len(gone))
+        # Each added entry is scored against everything else, past a batch it is
+        # cheaper to score all pairs again in blocks
+        if new > BATCH_ROWS:
+            self._score_all()
+            return
+        for key in gone:
+            self._remove(key)
+        self.stale.clear()
+        for key, entry in current.items():
+            if key not in self.known:
+                self._add(entry)
+
+    def groups(self, threshold: float) -> Tuple[List[List[Dict]], Dict[str, str]]:
+        entries = self.manager.get_entries()
+        self._sync(entries)
+        if self._ranked is None:
+            self._ranked = sorted(
+                (-scores[0], a, b) for a, others in self.fuzzy.items()
+                for b, scores in others.items() if a < b
+            )
+
+        pos = {id(e): k for k, e in enumerate(entries)}
+        matched = defaultdict(dict)  # position -> {later position: reason}
+        for a, others in self.hard.items():
+            for b, reason in others.items():
+                if pos[a] < pos[b]:
+                    matched[pos[a]][pos[b]] = reason
+        cut = bisect_right(self._ranked, (-threshold, float('inf'), float('inf')))
+        for _, a, b in self._ranked[:cut]:
+            i, j = sorted((pos[a], pos[b]))
+            matched[i][j] = _fuzzy_reason(*self.fuzzy[a][b])
+
+        return _greedy_groups(
+            entries,
+            lambda i: sorted(matched[i]) if i in matched else (),
+            lambda i, j: matched[i][j],
+        )
+
+
+# --- Search ---
+
+_WORD = re.compile(r'\w+')
+# field:value query terms; ID and ENTRYTYPE are searched as id: and type:
+_FIELD_TERM = re.compile(r'([a-z_]+):(.*)')
+FIELD_ALIASES = {'ID': 'id', 'ENTRYTYPE': 'type', 'entrytype': 'type', 'key': 'id'}
+
+
+def _words(value) -> List[str]:
+    return _WORD.findall(str(value).lower().replace('{', '').replace('}', ''))
+
+
+def _index_keys(entry: Dict) -> Set[Tuple[str, str]]:
+    """(field, word) for every word of every field, plus ('', word)."""
+    fields = entry.field_texts() if isinstance(entry, LazyEntry) else entry
+    keys = set()
+    for name, value in fields.items():
+        field = FIELD_ALIASES.get(name, name)
+        for word in _words(value):
+            keys.add((field, word))
+            keys.add(('', word))
+    return keys
+
+
+def _query_terms(query: str) -> List[Tuple[str, str]]:
+    """
+    'author:smi deep year:2020' -> [('author', 'smi'), ('', 'deep'), ('year', '2020')].
+    Every term is a word prefix, scoped to a field or ('') to any field.
+    """
+    terms = []
+    for part in query.lower().split():
+        field = ''
+        m = _FIELD_TERM.fullmatch(part)
+        if m:
+            field, part = FIELD_ALIASES.get(m.group(1), m.group(1)), m.group(2)
+        terms.extend((field, word) for word in _words(part))
+    return terms
+
+
+def _keys_match(keys: Set[Tuple[str, str]], terms: List[Tuple[str, str]]) -> bool:
+    return all(any(f == field and w.startswith(prefix) for f, w in keys) for field, prefix in terms)
+
+
+class SearchIndex:
+    """
+    Inverted index behind BibManager.search: (field, word) -> documents, with
+    the keys kept sorted so a word prefix is a range of them. Entries are
+    numbered in the order they are indexed, which is file order.
+    Edits and deletions are applied through invalidate(); entries appended
+    to the database are picked up on the next query.
+    """
+    def __init__(self, manager: 'BibManager'):
+        self.manager = manager
+        self.postings = defaultdict(set)  # (field, word) -> doc numbers
+        self.vocab = None  # sorted postings keys, rebuilt lazily after bulk adds
+        self.docs = {}  # doc number -> entry
+        self.doc_of = {}  # id(entry) -> doc number
+        self.doc_keys = {}  # doc number -> keys it is posted under
+        self.stale = set()  # doc numbers to re-index (or drop if deleted)
+        self.upto = 0  # db.entries positions indexed so far
+        self.next_doc = 0
+
+    def invalidate(self, entry: Dict):
+        """Unpost an edited or deleted entry; it is re-indexed on the next query if still there."""
+        doc = self.doc_of.get(id(entry))
+        if doc is None or self.docs[doc] is not entry:
+            return
+        for key in self.doc_keys.pop(doc, ()):
+            postings = self.postings[key]
+            postings.discard(doc)
+            if not postings:
+                del self.postings[key]
+                if self.vocab is not None:
+                    del self.vocab[bisect_left(self.vocab, key)]
+        self.stale.add(doc)
+
+    def _post(self, doc: int, entry: Dict):
+        self.docs[doc] = entry
+        self.doc_of[id(entry)] = doc
+        self.doc_keys[doc] = keys = _index_keys(entry)
+        for key in keys:
+            postings = self.postings[key]
+            if not postings and self.vocab is not None:
+                insort(self.vocab, key)
+            postings.add(doc)
+
+    def sync(self):
+        entries = self.manager.db.entries
+        if len(entries) - self.upto > BATCH_ROWS:
+            # Sorting once beats inserting every new word
+            self.vocab = None
+        for doc in self.stale:
+            entry = self.docs[doc]
+            if self.manager.is_live(entry):
+                self._post(doc, entry)
+            else:
+                del self.docs[doc]
+                del self.doc_of[id(entry)]
+        self.stale.clear()
+        # Entries a loading thread appends meanwhile are left for the next sync
+        new = entries[self.upto:]
+        for entry in new:
+            if entry is not None:
+                self._post(self.next_doc, entry)
+                self.next_doc += 1
+        self.upto += len(new)
+        if self.vocab is None:
+            self.vocab = sorted(self.postings)
+
+    def _prefix_docs(self, field: str, prefix: str) -> Set[int]:
+        docs = set()
+        vocab = self.vocab
+        k = bisect_left(vocab, (field, prefix))
+        while k < len(vocab) and vocab[k][0] == field and vocab[k][1].startswith(prefix):
+            docs |= self.postings[vocab[k]]
+            k += 1
+        return docs
+
+    def match(self, terms: List[Tuple[str, str]]) -> Set[int]:
+        """Doc numbers of the entries matching every term."""
+        self.sync()
+        result = None
+        for field, prefix in terms:
+            docs = self._prefix_docs(field, prefix)
+            result = docs if result is None else result & docs
+            if not result:
+                break
+        return result
+
+
+# --- Merging ---
+
+# How merge_group picks the kept entry and, for fields set on several
+# entries, the value: the first entry / the one with the most fields / the
+# newest year, or for 'longest' the longest value (kept entry: most fields)
+MERGE_PRECEDENCE = ('first', 'complete', 'newest', 'longest')
+# The default of every merge (BibManager methods, merge_bib, the TUI): keep
+# the entry find_duplicates matched the others against (or the one asked
+# for), completed with the fields only the others have
+DEFAULT_PRECEDENCE = 'first'
+
+
+class MergeRecord(NamedTuple):
+    """What merging one group of duplicates did."""
+    kept: str  # ID of the surviving entry
+    merged: Tuple[str, ...]  # IDs of the entries folded into it and deleted
+    reasons: Tuple[str, ...]  # Why each of them was a duplicate of it
+    fields: Tuple[str, ...]  # Where values came from, when not from the kept entry
+
+
+def _year(entry: Dict) -> int:
+    m = re.search(r'\d{4}', str(entry.get('year', '')))
+    return int(m.group()) if m else -1
+
+
+def _merge_fields(entries: List[Dict], precedence: str, keep: Optional[Dict] = None) -> Tuple[Dict, Dict, List[str]]:
+    """
+    Union of the fields of duplicate entries. Returns the entry to keep, the
+    fields to set on it and a note for every value taken from another entry
+    or chosen among differing ones.
+    """
+    if precedence == 'first':
+        ranked = list(entries)
+    elif precedence in ('complete', 'longest'):
+        ranked = sorted(entries, key=lambda e: -sum(_filled(v) for v in e.values()))
+    elif precedence == 'newest':
+        ranked = sorted(entries, key=lambda e: -_year(e))
+    else:
+        raise ValueError(f"Unknown merge precedence {precedence!r}, expected one of {MERGE_PRECEDENCE}")
+    if keep is None:
+        keep = ranked[0]
+
+    names = []
+    for e in ranked:
+        names.extend(name for name in e if name not in ('ID', 'ENTRYTYPE') and name not in names)
+    updates = {}
+    notes = []
+    for name in names:
+        candidates = [e for e in ranked if _filled(e.get(name, ''))]
+        if not candidates:
+            continue
+        if precedence == 'longest':
+            # max keeps the first of equally long values
+            chosen = max(candidates, key=lambda e: len(str(e[name]).strip()))
+        else:
+            chosen = candidates[0]
+        values = {str(e[name]).strip() for e in candidates}
+        if chosen is not keep and str(chosen[name]).strip() != str(keep.get(name, '')).strip():
+            updates[name] = chosen[name]
+            how = f" ({precedence}, {len(values)} values)" if len(values) > 1 else ""
+            notes.append(f"{name} from {chosen.get('ID')}{how}")
+        elif len(values) > 1:
+            notes.append(f"{name} kept ({precedence}, {len(values)} values)")
+    return keep, updates, notes
+
+
+# Incremental saves drop a deleted entry along with the whitespace after it
+_BLANK = re.compile(rb'\s*')
+
 
 class BibManager:
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, streaming: bool = False, autoload: bool = True, use_cache: bool = True):
+        """
+        streaming=True loads through a BibStream: entries are indexed from a
+        memory mapped scan and only parsed in full when needed.
+        autoload=False leaves loading to the caller (load() or stream_entries()).
+        use_cache=True reuses the on-disk cache of an unchanged file (see cache.py).
+        """
         self.filepath = filepath
-        self.db = None
-        self.load()
+        self.streaming = streaming
+        self.use_cache = use_cache
+        self.db = BibDatabase()
+        self._stream = None
+        self._features = {} # id(entry) -> (entry, EntryFeatures)
+        self._issues = {} # id(entry) -> (entry, issues), filled by find_incomplete
+        self._dup_index = None
+        self._search_index = None
+        self._positions = {} # ID -> positions in db.entries
+        self._live = None # db.entries without tombstones, rebuilt lazily
+        # Incremental saves: byte span in the file of each loaded entry (by
+        # position), positions edited since, and the file's (size, mtime) then
+        self._spans = None
+        self._dirty = set()
+        self._file_stamp = None
+        if autoload:
+            self.load()
 
     def load(self):
+        if self.streaming:
+            for _ in self.stream_entries():
+                pass
+            return
+        self._release_stream()
+        cached = load_cache(self.filepath) if self.use_cache else None
+        if cached is not None:
+            for _ in self._restore(cached):
+                pass
+            return
+        file_stamp = self._stat()
         with open(self.filepath, 'r', encoding='utf-8') as bibtex_file:
             parser = BibTexParser(common_strings=True)
             # DO NOT convert to lower case for keys/values
             parser.ignore_nonstandard_types = False
-            self.db = bibtexparser.load(bibtex_file, parser=parser)
+            db = bibtexparser.load(bibtex_file, parser=parser)
+        self.load_database(db)
+        self._file_stamp = file_stamp
+        self._store_cache()
+
+    def load_database(self, db: BibDatabase):
+        """
+        Work on an already parsed database, e.g. several files merged into one,
+        as if it had been loaded from filepath. Its entries are replaced by
+        CompactEntry records.
+        """
+        self._release_stream()
+        db.entries = [compact_entry(entry) for entry in db.entries]
+        self.db = db
+        self._features = {}
+        self._issues = {}
+        self._dup_index = None
+        self._search_index = None
+        self._spans = None
+        self._dirty = set()
+        self._reindex()
+        for entry in self.db.entries:
+            self.features(entry)
 
-    def save(self):
+    def stream_entries(self) -> Iterator[Dict]:
+        """
+        (Re)load the file incrementally, yielding each entry as soon as it has
+        been indexed. get_entries() grows while this runs.
+        """
+        self._release_stream()
+        cached = load_cache(self.filepath) if self.use_cache else None
+        # Without spans a cached load could not be saved incrementally
+        if cached is not None and cached['spans'] is not None:
+            yield from self._restore(cached)
+            return
+        self._stream = BibStream(self.filepath)
+        self._start_load(self._stream.database, [])
+        for entry, span in self._stream.blocks():
+            self._append_loaded(entry, span)
+            yield entry
+        self._store_cache()
+
+    def _start_load(self, database: BibDatabase, spans: Optional[List]):
+        self.db = BibDatabase()
+        self.db.comments = database.comments
+        self.db.preambles = database.preambles
+        self.db.strings = database.strings
+        self._features = {}
+        self._issues = {}
+        self._dup_index = None
+        self._search_index = None
+        self._spans = spans
+        self._dirty = set()
+        self._file_stamp = self._stat()
+        self._reindex()
+
+    def _append_loaded(self, entry: Dict, span: Optional[Tuple[int, int]]):
+        self._positions[entry.get('ID')].append(len(self.db.entries))
+        self.db.entries.append(entry)
+        if self._spans is not None:
+            self._spans.append(span)
+        self._live = None
+
+    def _restore(self, payload: Dict) -> Iterator[Dict]:
+        """Load from a cache payload; entries that were still lazy stay lazy."""
+        lazy = any(isinstance(record, tuple) for record in payload['entries'])
+        self._stream = BibStream(self.filepath) if lazy else None
+        database = self._stream.database if lazy else BibDatabase()
+        database.strings.update(payload['strings'])
+        database.preambles.extend(payload['preambles'])
+        database.comments.extend(payload['comments'])
+        spans = payload['spans']
+        self._start_load(database, None if spans is None else [])
+        for record, span, feats in zip(payload['entries'], spans or repeat(None), payload['features']):
+            entry = LazyEntry(self._stream, *record) if isinstance(record, tuple) else record
+            self._append_loaded(entry, span)
+            self._features[id(entry)] = (entry, feats)
+            yield entry
+
+    def _store_cache(self):
+        # Only a pristine load describes the file as it is on disk
+        if not self.use_cache or self._dirty or None in self.db.entries \
+                or self._stat() != self._file_stamp:
+            return
+        entries = self.db.entries
+        records = []
+        for entry in entries:
+            state = entry.lazy_state() if isinstance(entry, LazyEntry) else None
+            records.append(state if state is not None else compact_entry(entry))
+        store_cache(self.filepath, {
+            'entries': records,
+            'features': [self.features(entry) for entry in entries],
+            'spans': self._spans,
+            'strings': dict(self.db.strings),
+            'preambles': list(self.db.preambles),
+            'comments': list(self.db.comments),
+        })
+
+    def _release_stream(self):
+        """Parse whatever is still lazy and unmap the file (before it is rewritten)."""
+        if self._stream is None:
+            return
+        for entry in self.db.entries:
+            if isinstance(entry, LazyEntry):
+                entry.materialize()
+        self._stream.close()
+        self._stream = None
+
+    def _reindex(self):
+        self._positions = defaultdict(list)
+        for pos, entry in enumerate(self.db.entries):
+            if entry is not None:
+                self._positions[entry.get('ID')].append(pos)
+        self._live = None
+
+    def _compact(self):
+        """Drop the tombstones left by deletions (positions change)."""
+        if None in self.db.entries:
+            if self._search_index is not None:
+                # Catch up while positions are still those it has seen
+                self._search_index.sync()
+            if self._spans is not None:
+                self._spans = [span for span, entry in zip(self._spans, self.db.entries) if entry is not None]
+            self.db.entries = self.get_entries()
+            self._reindex()
+            if self._search_index is not None:
+                self._search_index.upto = len(self.db.entries)
+
+    def _stat(self) -> Tuple[int, int]:
+        st = os.stat(self.filepath)
+        return st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def _writer() -> BibTexWriter:
         writer = BibTexWriter()
         writer.indent = '  '
         writer.order_entries_by = None # preserve order
+        return writer
+
+    def save(self, incremental: bool = True):
+        """
+        With incremental=True (and a streaming load) only edited, deleted and
+        new entries are re-serialized; everything else, comments included, is
+        copied byte for byte. Falls back to rewriting the whole file when the
+        file changed on disk or an edited entry cannot be located in it.
+        """
+        if incremental and self._save_incremental():
+            return
+        self._compact()
+        self._release_stream()
         with open(self.filepath, 'w', encoding='utf-8') as bibtex_file:
-            bibtexparser.dump(self.db, bibtex_file, writer)
-            
+            bibtexparser.dump(self.db, bibtex_file, self._writer())
+        # Offsets are unknown after a full rewrite
+        self._spans = None
+        self._dirty = set()
+
+    def _save_incremental(self) -> bool:
+        if self._spans is None or self._stat() != self._file_stamp:
+            return False
+        with open(self.filepath, 'rb') as f:
+            data = f.read()
+
+        writer = self._writer()
+        def render(entry) -> bytes:
+            db = BibDatabase()
+            db.entries = [entry]
+            return writer.write(db).rstrip('\n').encode('utf-8')
+
+        out = bytearray()
+        spans = []
+        cursor = 0
+        loaded = self.db.entries[:len(self._spans)]
+        for pos, (entry, span) in enumerate(zip(loaded, self._spans)):
+            touched = entry is None or pos in self._dirty
+            if span is None:
+                if touched:
+                    return False
+                # Untouched, copied along with the text around it
+                spans.append(None)
+                continue
+            start, end = span
+            if start < cursor:
+                return False
+            out += data[cursor:start]
+            if entry is None:
+                # Drop the block and the blank lines after it
+                cursor = _BLANK.match(data, end).end()
+                continue
+            text = render(entry) if pos in self._dirty else data[start:end]
+            spans.append((len(out), len(out) + len(text)))
+            out += text
+            cursor = end
+        out += data[cursor:]
+        # Entries added since loading go at the end
+        for entry in self.db.entries[len(self._spans):]:
+            if entry is not None:
+                if out.strip():
+                    out += b'\n' if out.endswith(b'\n') else b'\n\n'
+                text = render(entry)
+                spans.append((len(out), len(out) + len(text)))
+                out += text + b'\n'
+
+        # Write next to the file and swap it in, so a failed save leaves the
+        # original untouched (and a lazily read mapping of it stays valid)
+        tmp_path = self.filepath + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(out)
+        shutil.copymode(self.filepath, tmp_path)
+        os.replace(tmp_path, self.filepath)
+
+        self._compact()
+        self._spans = spans
+        self._dirty = set()
+        self._file_stamp = self._stat()
+        return True
+
     def get_entries(self):
-        return self.db.entries
+        # Deleted entries are tombstoned (None) in db.entries until the next save
+        if self._live is None:
+            self._live = [e for e in self.db.entries if e is not None]
+        return self._live
+
+    def get(self, entry_id: str) -> Optional[Dict]:
+        """First entry with this BibTeX ID, or None."""
+        positions = self._positions.get(entry_id)
+        return self.db.entries[positions[0]] if positions else None
+
+    def features(self, entry: Dict) -> EntryFeatures:
+        """
+        Normalized fields of an entry, computed once and reused until the entry
+        is edited or deleted through this manager.
+        """
+        cached = self._features.get(id(entry))
+        # The cache holds a reference to the entry, so its id cannot be recycled
+        # by another dict while the slot is alive; the identity check is a guard
+        # against entries replaced behind our back.
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+        feats = _entry_features(entry)
+        self._features[id(entry)] = (entry, feats)
+        return feats
+
+    def _invalidate(self, entry: Dict):
+        self._features.pop(id(entry), None)
+        self._issues.pop(id(entry), None)
+        if self._dup_index is not None:
+            self._dup_index.invalidate(entry)
+        if self._search_index is not None:
+            self._search_index.invalidate(entry)
+
+    def is_live(self, entry: Dict) -> bool:
+        """Whether entry is (still) in the database, as this very object."""
+        return any(self.db.entries[pos] is entry for pos in self._positions.get(entry.get('ID'), ()))
+
+    def search(self, entries: List[Dict], term: str) -> List[Dict]:
+        """
+        Entries matching every word of the query `term`. Words match the start
+        of a word in any field, or in one field when written field:word
+        (author:smith year:2020, id: and type: for the key and entry type).
+        Answered from a SearchIndex; given get_entries() itself the cost only
+        depends on the number of matches.
+        """
+        terms = _query_terms(term)
+        if not terms:
+            return list(entries)
+        if self._search_index is None:
+            self._search_index = SearchIndex(self)
+        index = self._search_index
+        matched = index.match(terms)
+        if entries is self._live:
+            return [index.docs[doc] for doc in sorted(matched)]
+        filtered = []
+        for e in entries:
+            doc = index.doc_of.get(id(e))
+            if doc is not None and index.docs.get(doc) is e:
+                if doc in matched:
+                    filtered.append(e)
+            # Entries that are not in the index (copies) are matched directly
+            elif _keys_match(_index_keys(e), terms):
+                filtered.append(e)
+        return filtered
 
-    def find_duplicates(self, threshold=85.0) -> Tuple[List[List[Dict]], Dict[str, str]]:
+    def find_duplicates(self, threshold=85.0, exhaustive=False, batched=False) -> Tuple[List[List[Dict]], Dict[str, str]]:
         """
         Find duplicate entries using hard identifiers (DOI, URL, ID, exact title),
         falling back to fuzzy matching on normalized title and author.
+        Hard identifiers are resolved through hash maps and fuzzy comparisons only
+        run on candidate pairs produced by title blocking (see `_candidate_index`).
+        Pass batched=True to score all titles in native code with process.cdist
+        instead of blocking, or exhaustive=True to compare every pair like the
+        original double loop. Both give the exact result blocking approximates
+        and both grow with the square of the number of entries: batched=True is
+        a cross-check of the default, several times slower than it on tens of
+        thousands of entries, not the way to deduplicate a large file.
         Returns a tuple: (list of duplicate groups, dictionary of reasons by ID).
         """
-        duplicates_groups = []
-        reasons = {} # Maps ID -> Explainability string
-        visited_ids = set()
+        entries = self.get_entries()
+        features = [self.features(e) for e in entries]
         
-        entries = self.db.entries
+        # A non-positive threshold makes every titled pair a fuzzy candidate,
+        # blocking cannot help there.
+        if exhaustive or threshold <= 0:
+            candidates_of = lambda i: range(i + 1, len(entries))
+        elif batched:
+            candidates_of = _batched_candidates(features, threshold)
+        else:
+            candidates_of = _candidate_index(features)
         
-        for i, entry1 in enumerate(entries):
-            entry_id1 = entry1.get('ID')
-            if entry_id1 in visited_ids:
-                continue
-                
-            current_group = [entry1]
-            
-            # Normalize fields for base entry
-            title1 = utils.default_process(entry1.get('title', ''))
-            author1 = utils.default_process(entry1.get('author', ''))
-            doi1 = entry1.get('doi', '').strip().lower()
-            url1 = entry1.get('url', '').strip().lower()
-            
-            for j in range(i + 1, len(entries)):
-                entry2 = entries[j]
-                entry_id2 = entry2.get('ID')
-                if entry_id2 in visited_ids:
-                    continue
-                    
-                title2 = utils.default_process(entry2.get('title', ''))
-                author2 = utils.default_process(entry2.get('author', ''))
-                doi2 = entry2.get('doi', '').strip().lower()
-                url2 = entry2.get('url', '').strip().lower()
-                
-                is_duplicate = False
-                match_reason = ""
-
-                # 1. Hard Matches (Fast & Certain)
-                if entry_id1.lower() == entry_id2.lower():
-                    is_duplicate, match_reason = True, "Same BibTeX ID"
-                elif doi1 and doi2 and doi1 == doi2:
-                    is_duplicate, match_reason = True, f"Same DOI ({doi1})"
-                elif url1 and url2 and url1 == url2:
-                    is_duplicate, match_reason = True, "Same URL"
-                elif title1 and title2 and title1 == title2:
-                    is_duplicate, match_reason = True, "Exact Title Match"
-                    
-                # 2. Fuzzy Match Fallback
-                else:
-                    title_sim = fuzz.ratio(title1, title2) if title1 and title2 else 0.0
-                    author_sim = fuzz.token_sort_ratio(author1, author2) if author1 and author2 else 100.0
-                    
-                    if title_sim >= threshold and author_sim >= 70.0:
-                        is_duplicate = True
-                        match_reason = f"Fuzzy Match (Title: {title_sim:.0f}%, Author: {author_sim:.0f}%)"
-                        
-                if is_duplicate:
-                    current_group.append(entry2)
-                    visited_ids.add(entry_id2)
-                    reasons[entry_id2] = match_reason
-                    
-            if len(current_group) > 1:
-                duplicates_groups.append(current_group)
-                visited_ids.add(entry_id1)
-                reasons[entry_id1] = "Base Entry (Matched against this)"
-                
-        return duplicates_groups, reasons
+        return _greedy_groups(
+            entries, candidates_of,
+            lambda i, j: _match_reason(features[i], features[j], threshold),
+        )
+
+    def match_reason(self, e1: Dict, e2: Dict, threshold=85.0) -> str:
+        """Why find_duplicates would pair e1 with e2, an empty string if it would not."""
+        return _match_reason(self.features(e1), self.features(e2), threshold)
 
-    def find_incomplete(self) -> List[Dict]:
+    def duplicate_groups(self, threshold=85.0) -> Tuple[List[List[Dict]], Dict[str, str]]:
         """
-        Check for missing critical fields and tag them with reasons.
+        Same result as find_duplicates(threshold, batched=True), served from a
+        DuplicateIndex of stored pair scores. The first call scores every pair;
+        later calls with another threshold only re-threshold the stored scores,
+        and edited or deleted entries only have their own pairs recomputed.
         """
-        incomplete_entries = []
-        for entry in self.db.entries:
-            missing = []
-            entry_type = entry.get('ENTRYTYPE', '').lower()
-            
-            # 1. Check Global Required Fields
-            required_fields = ['title', 'year']
-            for req in required_fields:
-                if req not in entry or not str(entry.get(req, '')).strip():
-                    missing.append(req)
-            
-            # 2. Check Author/Editor (Specific to common types)
-            if entry_type in ['article', 'inproceedings', 'incollection', 'book']:
-                if 'author' not in entry and 'editor' not in entry:
-                    missing.append("author/editor")
-            
-            # 3. Check specific types (optional but helpful)
-            if entry_type == 'article' and 'journal' not in entry:
-                missing.append("journal")
-            elif entry_type in ['inproceedings', 'incollection'] and 'booktitle' not in entry:
-                missing.append("booktitle")
-
-            if missing:
-                # We create a copy to avoid mutating the original DB entry in memory 
-                # if you only want the reason to show up in this specific view
-                entry_copy = entry.copy()
-                entry_copy['reason_incomplete'] = f"Missing: {', '.join(missing)}"
-                incomplete_entries.append(entry_copy)
-                
-        return incomplete_entries
+        if threshold < PAIR_SCORE_FLOOR:
+            return self.find_duplicates(threshold, batched=True)
+        if self._dup_index is None:
+            self._dup_index = DuplicateIndex(self)
+        return self._dup_index.groups(threshold)
+
+    def find_incomplete(self) -> List[EntryIssues]:
+        """
+        Entries breaking a rule of VALIDATION_RULES, as (ID, issues, entry) records in
+        file order. Issues are kept until an entry is edited, so a call only
+        checks the entries added or edited since the last one. They are not
+        part of features(): the rules read fields a streaming load does not
+        keep, and duplicate detection must not parse every entry for them.
+        """
+        incomplete = []
+        for entry in self.get_entries():
+            cached = self._issues.get(id(entry))
+            if cached is not None and cached[0] is entry:
+                issues = cached[1]
+            else:
+                issues = entry_issues(entry)
+                self._issues[id(entry)] = (entry, issues)
+            if issues:
+                incomplete.append(EntryIssues(entry.get('ID'), issues, entry))
+        return incomplete
 
     def delete_entry(self, entry_id: str):
         """Delete an entry by its ID"""
-        self.db.entries = [e for e in self.db.entries if e.get('ID') != entry_id]
+        self.delete_entries([entry_id])
+
+    def delete_entries(self, entry_ids: Iterable[str]) -> int:
+        """
+        Delete every entry carrying one of the given IDs, returns how many were
+        removed. Entries are tombstoned in place, so this is linear in the
+        number of IDs rather than in the size of the bibliography.
+        """
+        deleted = 0
+        for entry_id in entry_ids:
+            for pos in self._positions.pop(entry_id, ()):
+                self._invalidate(self.db.entries[pos])
+                self.db.entries[pos] = None
+                deleted += 1
+        if deleted:
+            self._live = None
+        return deleted
         
-    def merge_entries(self, keep_id: str, delete_ids: List[str]):
+    def merge_entries(self, keep_id: str, delete_ids: List[str], precedence: str = DEFAULT_PRECEDENCE) -> Optional[MergeRecord]:
+        """
+        Merge the entries with 'delete_ids' into the one with 'keep_id', which
+        gets every field it lacks from them, then delete them. Values present
+        on several entries are picked by precedence (see MERGE_PRECEDENCE);
+        with 'first' the kept entry's own values win.
+        """
+        kept = self.get(keep_id)
+        if kept is None:
+            self.delete_entries(delete_ids)
+            return None
+        others = [self.db.entries[pos] for entry_id in delete_ids
+                  for pos in self._positions.get(entry_id, ()) if self.db.entries[pos] is not kept]
+        return self.merge_group([kept] + others, precedence, keep=kept)
+
+    def merge_group(self, group: List[Dict], precedence: str = DEFAULT_PRECEDENCE, keep: Optional[Dict] = None,
+                    threshold: float = 85.0) -> MergeRecord:
         """
-        Very simple merge: keep the entry with 'keep_id', delete the others.
-        (Could be expanded to merge specific fields)
+        Merge a group of duplicates (as returned by find_duplicates) into one
+        entry: 'keep', or the entry ranked first by precedence.
         """
-        for d_id in delete_ids:
-            self.delete_entry(d_id)
+        # Members were matched against the group's first entry, which need
+        # not be the one kept (itself matched against that first entry)
+        base = group[0] if group else None
+        # Entries deleted or merged since the group was computed are skipped
+        group = [e for e in group if self.is_live(e)]
+        kept, updates, notes = _merge_fields(group, precedence, keep)
+        merged = [e for e in group if e is not kept]
+        reasons = [self.match_reason(kept if e is base else base, e, threshold) or 'Merged on request'
+                   for e in merged]
+        if updates:
+            self._update_at(self._position_of(kept), updates)
+        for e in merged:
+            # By identity: duplicates may share the kept entry's ID
+            self._delete_at(self._position_of(e))
+        return MergeRecord(kept.get('ID'), tuple(e.get('ID') for e in merged), tuple(reasons), tuple(notes))
+
+    def merge_groups(self, groups: List[List[Dict]], precedence: str = DEFAULT_PRECEDENCE,
+                     threshold: float = 85.0) -> List[MergeRecord]:
+        """Merge every group in one pass (groups must not overlap, as find_duplicates' do not)."""
+        return [self.merge_group(group, precedence, threshold=threshold) for group in groups]
+
+    def merge_duplicates(self, threshold=85.0, precedence: str = DEFAULT_PRECEDENCE) -> List[MergeRecord]:
+        """find_duplicates, then merge each group."""
+        groups, _ = self.find_duplicates(threshold)
+        return self.merge_groups(groups, precedence, threshold)
+
+    def _position_of(self, entry: Dict) -> int:
+        return next(pos for pos in self._positions[entry.get('ID')] if self.db.entries[pos] is entry)
+
+    def _delete_at(self, pos: int):
+        entry = self.db.entries[pos]
+        positions = self._positions[entry.get('ID')]
+        positions.remove(pos)
+        if not positions:
+            del self._positions[entry.get('ID')]
+        self._invalidate(entry)
+        self.db.entries[pos] = None
+        self._live = None
             
     def update_entry(self, entry_id: str, new_data: dict):
         """Update an existing entry"""
-        for i, e in enumerate(self.db.entries):
-            if e.get('ID') == entry_id:
-                # Update but preserve ENTRYTYPE and ID if they exist
-                for k, v in new_data.items():
-                    self.db.entries[i][k] = v
-                break
+        positions = self._positions.get(entry_id)
+        if not positions:
+            return
+        self._update_at(positions[0], new_data)
+
+    def update_live(self, entry: Dict, new_data: dict) -> bool:
+        """
+        Update this very entry, which may share its ID with others (unlike
+        update_entry, which updates the first one). False if it is no longer
+        in the bibliography.
+        """
+        if not self.is_live(entry):
+            return False
+        self._update_at(self._position_of(entry), new_data)
+        return True
+
+    def delete_live(self, entries: Iterable[Dict]) -> int:
+        """Delete these very entries, leaving others with the same IDs; returns how many were removed."""
+        deleted = 0
+        for entry in entries:
+            if self.is_live(entry):
+                self._delete_at(self._position_of(entry))
+                deleted += 1
+        return deleted
+
+    def _update_at(self, pos: int, new_data: dict):
+        entry = self.db.entries[pos]
+        entry_id = entry.get('ID')
+        # Update but preserve ENTRYTYPE and ID if they exist
+        for k, v in new_data.items():
+            entry[k] = v
+        self._invalidate(entry)
+        self._dirty.add(pos)
+        if entry.get('ID') != entry_id:
+            positions = self._positions[entry_id]
+            positions.remove(pos)
+            if not positions:
+                del self._positions[entry_id]
+            insort(self._positions[entry.get('ID')], pos)
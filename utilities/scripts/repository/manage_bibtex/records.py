@@ -0,0 +1,127 @@
+"""
+Compact in-memory entries.
+
+A parsed entry is a dict of a dozen fields, and a large bibliography holds
+hundreds of thousands of them with the same few field layouts and the same
+journal names repeated over and over. CompactEntry stores the values of an
+entry in a tuple next to a Shape (the ordered field names, shared by every
+entry with that layout), and the values of INTERNED_FIELDS are interned so
+each distinct journal or publisher name is held once. It behaves like the
+dict it replaces, so BibManager, the writer and the TUI use it unchanged.
+"""
+import sys
+from collections.abc import ItemsView, MutableMapping, ValuesView
+from typing import Dict, Iterable, Mapping, Tuple
+
+# Fields whose values repeat across entries
+INTERNED_FIELDS = frozenset((
+    'ENTRYTYPE', 'journal', 'booktitle', 'publisher', 'year', 'month', 'series',
+    'school', 'institution', 'organization', 'address', 'language', 'type', 'howpublished',
+))
+
+
+class Shape:
+    """The ordered field names of entries, shared by all entries with them."""
+    __slots__ = ('names', 'index')
+
+    def __init__(self, names: Tuple[str, ...]):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+
+
+_SHAPES: Dict[Tuple[str, ...], Shape] = {}
+
+
+def shape_of(names: Iterable[str]) -> Shape:
+    names = tuple(sys.intern(name) for name in names)
+    shape = _SHAPES.get(names)
+    if shape is None:
+        shape = _SHAPES[names] = Shape(names)
+    return shape
+
+
+def _intern(name: str, value):
+    return sys.intern(value) if name in INTERNED_FIELDS and type(value) is str else value
+
+
+class _Items(ItemsView):
+    __slots__ = ()
+
+    def __iter__(self):
+        return zip(self._mapping._shape.names, self._mapping._values)
+
+
+class _Values(ValuesView):
+    __slots__ = ()
+
+    def __iter__(self):
+        return iter(self._mapping._values)
+
+
+class CompactEntry(MutableMapping):
+    """Dict-compatible entry made of a shared Shape and a tuple of values."""
+    __slots__ = ('_shape', '_values')
+
+    def __init__(self, fields: Mapping = ()):
+        fields = dict(fields)
+        self._shape = shape_of(fields)
+        self._values = tuple(_intern(name, value) for name, value in fields.items())
+
+    def __getitem__(self, key):
+        return self._values[self._shape.index[key]]
+
+    def get(self, key, default=None):
+        i = self._shape.index.get(key)
+        return default if i is None else self._values[i]
+
+    def __contains__(self, key):
+        return key in self._shape.index
+
+    def __iter__(self):
+        return iter(self._shape.names)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __setitem__(self, key, value):
+        value = _intern(key, value)
+        i = self._shape.index.get(key)
+        if i is None:
+            self._shape = shape_of(self._shape.names + (key,))
+            self._values += (value,)
+        else:
+            self._values = self._values[:i] + (value,) + self._values[i + 1:]
+
+    def __delitem__(self, key):
+        i = self._shape.index[key]
+        names = self._shape.names
+        self._shape = shape_of(names[:i] + names[i + 1:])
+        self._values = self._values[:i] + self._values[i + 1:]
+
+    def values(self):
+        return _Values(self)
+
+    def items(self):
+        return _Items(self)
+
+    def copy(self) -> Dict:
+        return dict(zip(self._shape.names, self._values))
+
+    def __reduce__(self):
+        # Pickled as names and values, the shape is looked up again on load
+        return _unpickle, (self._shape.names, self._values)
+
+    def __repr__(self):
+        return repr(self.copy())
+
+
+def _unpickle(names: Tuple[str, ...], values: Tuple) -> CompactEntry:
+    entry = CompactEntry.__new__(CompactEntry)
+    entry._shape = shape_of(names)
+    entry._values = values
+    return entry
+
+
+def compact_entry(entry: Mapping) -> CompactEntry:
+    """entry as a CompactEntry (itself if it already is one)."""
+    return entry if type(entry) is CompactEntry else CompactEntry(entry.items())
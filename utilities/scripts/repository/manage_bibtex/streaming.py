@@ -0,0 +1,352 @@
+"""
+Streaming BibTeX loader.
+
+The file is memory mapped and scanned for block boundaries. For every
+well-formed entry only a light header is kept (type, ID, the field names and
+the simple values of HEADER_FIELDS); the full field values are parsed by
+bibtexparser the first time something else is read from the entry.
+Anything the scanner does not fully understand (comments, @string, macros in
+header fields, malformed entries) is handed to bibtexparser right away, so
+the loaded database is the same as with bibtexparser.load.
+"""
+import mmap
+import re
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, Optional, Tuple
+
+from bibtexparser.bparser import BibTexParser
+
+from records import compact_entry
+
+# Fields available without parsing the entry: what the table and the
+# duplicate/incomplete checks read (see models.VALIDATION_RULES)
+HEADER_FIELDS = ('title', 'author', 'year', 'doi', 'url', 'editor', 'journal', 'booktitle')
+
+_BOM = b'\xef\xbb\xbf'
+_SKIP_WS = re.compile(rb'\s*')
+_BLOCK = re.compile(rb'@([A-Za-z]+)\s*([{(]?)')
+_BRACES = re.compile(rb'[{}]')
+_BRACES_PARENS = re.compile(rb'[{}()]')
+# bibtexparser ends comments at a line starting with '@'
+_NEXT_LINE_AT = re.compile(rb'\n\s*@')
+
+# Header tokenizer (on decoded entry text)
+_ENTRY_HEAD = re.compile(r'@([A-Za-z]+)\s*([{(])\s*([^,\s]+)\s*,')
+_FIELD_NAME = re.compile(r'\s*([A-Za-z0-9_\-().+]+)\s*=\s*')
+_INTEGER = re.compile(r'\d+')
+_STRING_NAME = re.compile(r'[A-Za-z0-9_\-:]+')
+_WS = re.compile(r'\s*')
+_TEXT_BRACES = re.compile(r'[{}]')
+_QUOTED_STOP = re.compile(r'["{}]')
+
+# Field name sets of lazy entries, shared between entries with the same fields
+_NAME_SETS: Dict[frozenset, frozenset] = {}
+
+
+def _strip_after_new_lines(s: str) -> str:
+    # Same cleaning bibtexparser applies to every field value
+    lines = s.splitlines()
+    if len(lines) > 1:
+        lines = [lines[0]] + [l.lstrip() for l in lines[1:]]
+    return '\n'.join(lines)
+
+
+def _matching_close(data, start: int, opener: bytes) -> Optional[int]:
+    """Offset just past the delimiter closing the one at `start`, if any."""
+    depth = 0
+    if opener == b'{':
+        for m in _BRACES.finditer(data, start):
+            depth += 1 if m.group() == b'{' else -1
+            if depth == 0:
+                return m.end()
+        return None
+    for m in _BRACES_PARENS.finditer(data, start + 1):
+        c = m.group()
+        if c == b'{':
+            depth += 1
+        elif c == b'}':
+            depth -= 1
+        elif c == b')' and depth == 0:
+            return m.end()
+    return None
+
+
+def _braced_end(text: str, start: int) -> int:
+    depth = 0
+    for m in _TEXT_BRACES.finditer(text, start):
+        depth += 1 if m.group() == '{' else -1
+        if depth == 0:
+            return m.end()
+    return -1
+
+
+def _quoted_end(text: str, start: int) -> int:
+    pos = start + 1
+    while True:
+        m = _QUOTED_STOP.search(text, pos)
+        if m is None or m.group() == '}':
+            return -1
+        if m.group() == '"':
+            return m.end()
+        pos = _braced_end(text, m.start())
+        if pos < 0:
+            return -1
+
+
+def _scan_fields(text: str) -> Optional[Tuple[str, str, list]]:
+    """
+    Tokenize one '@type{key, field = value, ...}' block into its type, key and
+    (lowercased field name, pieces) pairs, where pieces are ('int' | 'str' |
+    'macro', text) for the parts of the value joined by '#'. None when the
+    block is not something this tokenizer can vouch for.
+    """
+    m = _ENTRY_HEAD.match(text)
+    if m is None:
+        return None
+    entry_type, opener, key = m.groups()
+    closer = '}' if opener == '{' else ')'
+    fields = []
+    pos = m.end()
+
+    while True:
+        field = _FIELD_NAME.match(text, pos)
+        if field is None:
+            return None
+        name = field.group(1).lower()
+        pos = field.end()
+
+        # Value: an integer, or quoted/braced strings and macros joined by '#'
+        integer = _INTEGER.match(text, pos)
+        if integer:
+            pieces = [('int', integer.group())]
+            pos = integer.end()
+        else:
+            pieces = []
+            while True:
+                c = text[pos:pos + 1]
+                if c == '{':
+                    end = _braced_end(text, pos)
+                elif c == '"':
+                    end = _quoted_end(text, pos)
+                else:
+                    string_name = _STRING_NAME.match(text, pos)
+                    end = string_name.end() if string_name else -1
+                    c = ''
+                if end < 0:
+                    return None
+                pieces.append(('str', text[pos + 1:end - 1]) if c else ('macro', text[pos:end]))
+                pos = _WS.match(text, end).end()
+                if text[pos:pos + 1] != '#':
+                    break
+                pos = _WS.match(text, pos + 1).end()
+        fields.append((name, pieces))
+
+        pos = _WS.match(text, pos).end()
+        c = text[pos:pos + 1]
+        if c == ',':
+            pos = _WS.match(text, pos + 1).end()
+            c = text[pos:pos + 1]
+        elif c != closer:
+            return None
+        if c == closer:
+            if pos + 1 != len(text):
+                return None
+            return entry_type, key, fields
+
+
+def parse_header(text: str) -> Optional[Tuple[Dict[str, str], frozenset]]:
+    """
+    Tokenize one '@type{key, field = value, ...}' block. Returns the header
+    (ENTRYTYPE, ID and the simple values of HEADER_FIELDS, cleaned like
+    bibtexparser does) and the set of keys the parsed entry will have, or None
+    when the block is not something this tokenizer can vouch for.
+    """
+    scanned = _scan_fields(text)
+    if scanned is None:
+        return None
+    entry_type, key, fields = scanned
+    header = {'ENTRYTYPE': entry_type.lower(), 'ID': key}
+    names = set()
+    for name, pieces in fields:
+        if name in names:
+            # Repeated fields follow bibtexparser's ordering rules, let it decide
+            return None
+        names.add(name)
+        # Only a lone integer, braced or quoted string is a plain value
+        if name in HEADER_FIELDS and len(pieces) == 1 and pieces[0][0] != 'macro':
+            value = _strip_after_new_lines(pieces[0][1])
+            header[name] = '' if not value or value == '{}' else value
+    names.update(('ENTRYTYPE', 'ID'))
+    return header, frozenset(names)
+
+
+class LazyEntry(MutableMapping):
+    """
+    Dict-compatible entry backed by a span of a BibStream. Header fields and
+    membership tests are answered from the scan; anything else parses the
+    entry once and from then on behaves like the parsed dict.
+    """
+    __slots__ = ('_stream', '_span', '_header', '_names', '_fields')
+
+    def __init__(self, stream: 'BibStream', span: Tuple[int, int], header: Dict[str, str], names: frozenset):
+        self._stream = stream
+        self._span = span
+        self._header = compact_entry(header)
+        self._names = _NAME_SETS.setdefault(names, names)
+        self._fields = None
+
+    @property
+    def materialized(self) -> bool:
+        return self._fields is not None
+
+    def materialize(self) -> Dict:
+        if self._fields is None:
+            self._fields = self._stream.parse_entry(*self._span)
+            self._header = self._names = None
+        return self._fields
+
+    def lazy_state(self) -> Optional[Tuple]:
+        """(span, header, names) to rebuild the entry with, None once parsed."""
+        if self._fields is not None:
+            return None
+        return self._span, self._header, self._names
+
+    def field_texts(self) -> Dict[str, str]:
+        """
+        Every field as text, with macros expanded but otherwise raw, without
+        parsing the entry. Good enough to search in.
+        """
+        if self._fields is not None:
+            return dict(self._fields)
+        entry_type, key, fields = _scan_fields(self._stream.text(*self._span))
+        strings = self._stream.database.strings
+        texts = {'ENTRYTYPE': entry_type.lower(), 'ID': key}
+        for name, pieces in fields:
+            texts[name] = ''.join(str(strings.get(text, text)) if kind == 'macro' else text
+                                  for kind, text in pieces)
+        return texts
+
+    def __getitem__(self, key):
+        if self._fields is None:
+            if key in self._header:
+                return self._header[key]
+            if key not in self._names:
+                raise KeyError(key)
+        return self.materialize()[key]
+
+    def __contains__(self, key):
+        return key in (self._names if self._fields is None else self._fields)
+
+    def __iter__(self):
+        return iter(self.materialize())
+
+    def __len__(self):
+        return len(self._names if self._fields is None else self._fields)
+
+    def __setitem__(self, key, value):
+        self.materialize()[key] = value
+
+    def __delitem__(self, key):
+        del self.materialize()[key]
+
+    def copy(self) -> Dict:
+        return dict(self.materialize())
+
+    def __repr__(self):
+        if self._fields is None:
+            return f"LazyEntry({self._header!r})"
+        return repr(self._fields)
+
+
+class BibStream:
+    """
+    Memory mapped .bib file. entries() yields the file's entries in order
+    while scanning; @string, @preamble and comments are parsed along the way
+    into `database`, whose strings are used when lazy entries get parsed.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.parser = BibTexParser(common_strings=True)
+        # DO NOT convert to lower case for keys/values
+        self.parser.ignore_nonstandard_types = False
+        self.parser.expect_multiple_parse = True
+        self.database = self.parser.bib_database
+        self._lock = threading.Lock()
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            self._map = b''
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def text(self, start: int, end: int) -> str:
+        return self._map[start:end].decode('utf-8')
+
+    def _parse(self, start: int, end: int) -> list:
+        text = self.text(start, end)
+        with self._lock:
+            first = len(self.database.entries)
+            self.parser.parse(text)
+            parsed = self.database.entries[first:]
+            del self.database.entries[first:]
+        return [compact_entry(entry) for entry in parsed]
+
+    def parse_entry(self, start: int, end: int) -> Dict:
+        return self._parse(start, end)[0]
+
+    def entries(self) -> Iterator[Dict]:
+        for entry, _ in self.blocks():
+            yield entry
+
+    def blocks(self) -> Iterator[Tuple[Dict, Optional[Tuple[int, int]]]]:
+        """
+        Like entries(), paired with the byte span of each entry in the file
+        (None when the entry came out of a chunk it cannot be located in).
+        """
+        data = self._map
+        size = len(data)
+        pos = len(_BOM) if data[:len(_BOM)] == _BOM else 0
+        while True:
+            pos = _SKIP_WS.match(data, pos).end()
+            if pos >= size:
+                return
+
+            block = _BLOCK.match(data, pos)
+            end = None
+            if block and block.group(2):
+                kind = block.group(1).lower()
+                end = _matching_close(data, block.end() - 1, block.group(2))
+                if end is not None and kind in (b'string', b'preamble'):
+                    for entry in self._parse(pos, end):
+                        yield entry, None
+                    pos = end
+                    continue
+                if end is not None and kind != b'comment':
+                    parsed = parse_header(data[pos:end].decode('utf-8'))
+                    if parsed is not None:
+                        yield LazyEntry(self, (pos, end), *parsed), (pos, end)
+                        pos = end
+                        continue
+                else:
+                    end = None
+
+            # Comments and blocks we cannot vouch for: let bibtexparser read
+            # everything up to the next line starting with '@'
+            nxt = _NEXT_LINE_AT.search(data, pos)
+            chunk_end = nxt.start() if nxt else size
+            parsed = self._parse(pos, chunk_end)
+            # A chunk holding one complete block and nothing else: the entry
+            # parsed from it sits at that block
+            span = None
+            if end is not None and len(parsed) == 1 and end <= chunk_end \
+                    and not data[end:chunk_end].strip():
+                span = (pos, end)
+            for entry in parsed:
+                yield entry, span
+            pos = chunk_end
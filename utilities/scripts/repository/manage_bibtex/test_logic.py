@@ -1,9 +1,19 @@
 import unittest
 import os
-from models import BibManager
+import shutil
+import tempfile
+from unittest import mock
+from benchmark import generate_bib, pair_scores
+from cache import load_cache
+from merge_bib import merge_files
+from models import BibManager, SearchIndex
+from records import CompactEntry
 
 class TestBibManager(unittest.TestCase):
     def setUp(self):
+        self.cache_home = tempfile.mkdtemp()
+        self.env = mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.cache_home})
+        self.env.start()
         self.test_file = 'test.bib'
         with open(self.test_file, 'w') as f:
             f.write('''
@@ -29,20 +39,267 @@ class TestBibManager(unittest.TestCase):
     def tearDown(self):
         if os.path.exists(self.test_file):
             os.remove(self.test_file)
+        self.env.stop()
+        shutil.rmtree(self.cache_home)
 
     def test_find_duplicates(self):
-        dups = self.manager.find_duplicates()
+        dups, reasons = self.manager.find_duplicates()
         self.assertEqual(len(dups), 1)
         self.assertEqual(len(dups[0]), 2)
         keys = {e['ID'] for e in dups[0]}
         self.assertTrue('key1' in keys)
         self.assertTrue('key2' in keys)
 
+    def test_find_duplicates_reasons(self):
+        _, reasons = self.manager.find_duplicates()
+        self.assertEqual(reasons, {
+            'key1': "Base Entry (Matched against this)",
+            'key2': "Exact Title Match",
+        })
+
+    def test_blocking_matches_exhaustive(self):
+        with open(self.test_file, 'a') as f:
+            f.write('''
+@article{key4,
+    title = {A Very Importnt Paper},
+    author = {Smith, John},
+    year = {2021}
+}
+
+@misc{KEY3,
+    title = {Unrelated},
+    doi = {10.1000/xyz}
+}
+
+@misc{key5,
+    title = {Yet Another Title},
+    doi = {10.1000/XYZ }
+}
+
+@misc{key6,
+    title = {Completely Diferent Titles},
+    url = {https://example.org/paper}
+}
+''')
+        self.manager.load()
+        for threshold in (0, 50, 85, 95):
+            blocked = self.manager.find_duplicates(threshold)
+            batched = self.manager.find_duplicates(threshold, batched=True)
+            exhaustive = self.manager.find_duplicates(threshold, exhaustive=True)
+            self.assertEqual(blocked, exhaustive)
+            self.assertEqual(batched, exhaustive)
+
+    def test_edit_invalidates_cached_fields(self):
+        self.manager.find_duplicates()
+        self.manager.update_entry('key2', {'title': 'Something Else Entirely'})
+        dups, _ = self.manager.find_duplicates()
+        self.assertEqual(dups, [])
+        found = self.manager.search(self.manager.get_entries(), 'something else')
+        self.assertEqual([e['ID'] for e in found], ['key2'])
+
+    def test_duplicate_groups_follow_threshold_and_edits(self):
+        for threshold in (95, 60, 85):
+            self.assertEqual(self.manager.duplicate_groups(threshold),
+                             self.manager.find_duplicates(threshold, exhaustive=True))
+        self.manager.update_entry('key3', {'title': 'A Very Important Paper!'})
+        self.assertEqual(self.manager.duplicate_groups(85),
+                         self.manager.find_duplicates(85, exhaustive=True))
+        self.manager.delete_entry('key1')
+        self.assertEqual(self.manager.duplicate_groups(85),
+                         self.manager.find_duplicates(85, exhaustive=True))
+
+    def test_get_and_bulk_delete(self):
+        self.assertEqual(self.manager.get('key2')['title'], 'a very important paper')
+        self.assertEqual(self.manager.delete_entries(['key1', 'key3', 'missing']), 2)
+        self.assertIsNone(self.manager.get('key1'))
+        self.assertEqual([e['ID'] for e in self.manager.get_entries()], ['key2'])
+        self.manager.save()
+        self.assertEqual([e['ID'] for e in self.manager.db.entries], ['key2'])
+        self.manager.load()
+        self.assertEqual([e['ID'] for e in self.manager.get_entries()], ['key2'])
+
+    def test_streaming_load_matches_full_parse(self):
+        streamed = BibManager(self.test_file, streaming=True)
+        entries = streamed.get_entries()
+        self.assertEqual([e['title'] for e in entries],
+                         [e['title'] for e in self.manager.get_entries()])
+        # Header fields and membership are answered without parsing
+        self.assertTrue('author' in entries[0])
+        self.assertFalse('booktitle' in entries[1])
+        self.assertFalse(any(e.materialized for e in entries))
+        self.assertEqual([dict(e) for e in entries], self.manager.get_entries())
+        streamed.save()
+        self.assertEqual(BibManager(self.test_file).get_entries(), self.manager.get_entries())
+
+    def test_streamed_entries_stay_lazy_through_duplicate_detection(self):
+        with open(self.test_file, 'a') as f:
+            f.write('@article{key4, title = {Another Paper}, author = {Roe, Rick}, journal = {Nature}, year = {2021}}\n'
+                    '@inproceedings{key5, title = {A Talk}, editor = {Poe, Ed}, booktitle = {Proc. of Things}, year = {2022}}\n')
+        for _ in range(2):  # Parsed, then restored from the cache
+            streamed = BibManager(self.test_file, streaming=True)
+            streamed.find_duplicates()
+            streamed.duplicate_groups()
+            self.assertFalse(any(e.materialized for e in streamed.get_entries()))
+        self.assertEqual([r.ID for r in streamed.find_incomplete()], ['key1', 'key2', 'key3'])
+
+    def test_incremental_save_keeps_untouched_entries(self):
+        with open(self.test_file) as f:
+            original = f.read()
+        streamed = BibManager(self.test_file, streaming=True)
+        streamed.update_entry('key2', {'title': 'Edited'})
+        streamed.delete_entries(['key3'])
+        streamed.save()
+        with open(self.test_file) as f:
+            saved = f.read()
+        # Everything up to the edited entry is kept byte for byte
+        self.assertTrue(saved.startswith(original[:original.index('@inproceedings')]), saved)
+        self.assertNotIn('key3', saved)
+        reloaded = BibManager(self.test_file).get_entries()
+        self.assertEqual([e['ID'] for e in reloaded], ['key1', 'key2'])
+        self.assertEqual(reloaded[1]['title'], 'Edited')
+
+    def test_cache_reused_until_file_changes(self):
+        self.assertIsNotNone(load_cache(self.test_file))
+        self.assertEqual(BibManager(self.test_file).get_entries(), self.manager.get_entries())
+        with open(self.test_file, 'a') as f:
+            f.write('@misc{key4, title = {New}}\n')
+        self.assertIsNone(load_cache(self.test_file))
+        self.assertEqual(BibManager(self.test_file).get('key4')['title'], 'New')
+
+    def test_search_prefix_and_fields(self):
+        entries = self.manager.get_entries()
+        ids = lambda found: [e['ID'] for e in found]
+        self.assertEqual(ids(self.manager.search(entries, 'import')), ['key1', 'key2'])
+        self.assertEqual(ids(self.manager.search(entries, 'author:smi year:2020')), ['key1', 'key2'])
+        self.assertEqual(ids(self.manager.search(entries, 'author:john')), ['key1'])
+        self.assertEqual(ids(self.manager.search(entries, 'type:inproc')), ['key2'])
+        self.assertEqual(ids(self.manager.search(entries, 'title:smith')), [])
+        self.assertEqual(ids(self.manager.search(entries[1:], 'paper')), ['key2'])
+        self.manager.update_entry('key3', {'journal': 'Nature Physics'})
+        self.manager.delete_entries(['key1'])
+        entries = self.manager.get_entries()
+        self.assertEqual(ids(self.manager.search(entries, 'journal:nat')), ['key3'])
+        self.assertEqual(ids(self.manager.search(entries, 'john')), [])
+
+    def test_search_index_catches_entries_appended_while_syncing(self):
+        late = {'ENTRYTYPE': 'article', 'ID': 'late', 'title': 'Appended by the loader'}
+        index = SearchIndex(self.manager)
+        post = index._post
+
+        def post_while_loading(doc, entry):
+            if doc == 0:
+                self.manager._append_loaded(late, None)
+            post(doc, entry)
+
+        with mock.patch.object(index, '_post', post_while_loading):
+            index.sync()
+        self.manager._search_index = index
+        self.assertEqual(self.manager.search(self.manager.get_entries(), 'loader'), [late])
+
+    def test_merge_files_across_files(self):
+        other = 'test_other.bib'
+        with open(other, 'w') as f:
+            f.write('@article{other1, title = {A very important paper!}, author = {Smith, John}, doi = {10.1/x}}\n'
+                    '@misc{other2, title = {Something Else}}\n')
+        try:
+            manager, report = merge_files([self.test_file, other], 'merged.bib', jobs=1, use_cache=False)
+        finally:
+            os.remove(other)
+        self.assertEqual([e['ID'] for e in manager.get_entries()], ['key1', 'key3', 'other2'])
+        merged = report['entries'][0]['merged']
+        self.assertEqual([(m['ID'], m['source']) for m in merged], [('key2', self.test_file), ('other1', other)])
+        self.assertEqual(report['entries'][2]['source'], other)
+
+    def test_merge_entries_unions_fields(self):
+        self.manager.update_entry('key2', {'doi': '10.1/x', 'year': '2021'})
+        record = self.manager.merge_entries('key1', ['key2'])
+        self.assertEqual(record.merged, ('key2',))
+        self.assertIn('doi from key2', record.fields)
+        self.assertIn('year kept (first, 2 values)', record.fields)
+        key1 = self.manager.get('key1')
+        self.assertEqual((key1['doi'], key1['year']), ('10.1/x', '2020'))
+        self.assertIsNone(self.manager.get('key2'))
+
+    def test_merge_duplicates_in_bulk(self):
+        self.manager.update_entry('key2', {'doi': '10.1/x', 'pages': '1--10'})
+        records = self.manager.merge_duplicates(precedence='complete')
+        # key2 has more fields, so it is kept and gets nothing from key1
+        self.assertEqual([(r.kept, r.merged) for r in records], [('key2', ('key1',))])
+        self.assertEqual(records[0].reasons, ('Exact Title Match',))
+        self.assertIn('title kept (complete, 2 values)', records[0].fields)
+        self.assertEqual([e['ID'] for e in self.manager.get_entries()], ['key2', 'key3'])
+        records = self.manager.merge_duplicates(precedence='longest')
+        self.assertEqual(records, [])
+
+    def test_merge_reasons_when_kept_is_not_the_base(self):
+        # key1 is the base: key2 matches it on title, key4 on DOI only
+        self.manager.update_entry('key1', {'doi': '10.1/x'})
+        self.manager.update_entry('key2', {'journal': 'Nature', 'pages': '1--10', 'volume': '3'})
+        self.manager.save()
+        with open(self.test_file, 'a') as f:
+            f.write('@article{key4, title = {Unrelated}, doi = {10.1/x}}\n')
+        manager = BibManager(self.test_file, use_cache=False)
+        groups, _ = manager.find_duplicates()
+        record = manager.merge_group(groups[0], 'complete')
+        self.assertEqual(record.kept, 'key2')
+        self.assertEqual(dict(zip(record.merged, record.reasons)),
+                         {'key1': 'Exact Title Match', 'key4': 'Same DOI (10.1/x)'})
+
+    def test_benchmark_generator_ground_truth(self):
+        path = os.path.join(self.cache_home, 'bench.bib')
+        truth = generate_bib(path, 300, dup_rate=0.2, typo_rate=0.0, seed=1)
+        manager = BibManager(path, use_cache=False)
+        self.assertEqual(len(manager.get_entries()), 300)
+        self.assertGreater(300 - len(set(truth)), 30)
+        position = {e['ID']: i for i, e in enumerate(manager.get_entries())}
+        groups, _ = manager.find_duplicates()
+        groups = [[position[e['ID']] for e in group] for group in groups]
+        # Without typos every duplicate keeps the exact title
+        self.assertEqual(pair_scores(groups, truth), (1.0, 1.0))
+        self.assertEqual(pair_scores([[0, 1]], [0, 1, 1]), (0.0, 0.0))
+
+    def test_entries_are_compact(self):
+        key1, key2, _ = self.manager.get_entries()
+        self.assertIsInstance(key1, CompactEntry)
+        self.assertIs(key1._shape, key2._shape)
+        self.assertEqual(key1, {'ENTRYTYPE': 'article', 'ID': 'key1', 'title': 'A Very Important Paper',
+                                'author': 'Smith, John and Doe, Jane', 'year': '2020'})
+        self.manager.update_entry('key1', {'journal': 'Nature', 'year': '2021'})
+        del key1['author']
+        self.assertEqual((key1['year'], list(key1.items())[-1]), ('2021', ('journal', 'Nature')))
+        self.assertNotIn('author', key1)
+        self.manager.save()
+        reloaded = BibManager(self.test_file, use_cache=False).get('key1')
+        self.assertEqual(reloaded, key1)
+
     def test_find_incomplete(self):
         inc = self.manager.find_incomplete()
-        # key3 is missing author and year is empty
-        self.assertEqual(len(inc), 1)
-        self.assertEqual(inc[0]['ID'], 'key3')
+        # key1 has no journal, key2 no booktitle; key3 is missing author and year is empty
+        self.assertEqual([r.ID for r in inc], ['key1', 'key2', 'key3'])
+        self.assertEqual(inc[2].issues, ('missing year', 'missing journal', 'missing author/editor'))
+        self.manager.update_entry('key1', {'journal': 'Nature', 'doi': 'doi.org/10.1/x', 'year': '20'})
+        self.assertEqual(self.manager.find_incomplete()[0].issues, ('malformed year', 'malformed doi'))
+
+    def test_update_and_delete_live_leave_entries_sharing_the_id(self):
+        with open(self.test_file, 'a') as f:
+            f.write('@article{key1,\n    title = {Second},\n    author = {B}\n}\n')
+        manager = BibManager(self.test_file, use_cache=False)
+        first, second = [e for e in manager.get_entries() if e['ID'] == 'key1']
+        self.assertTrue(manager.update_live(second, {'title': 'Second edited'}))
+        self.assertEqual([e['title'] for e in manager.get_entries() if e['ID'] == 'key1'],
+                         ['A Very Important Paper', 'Second edited'])
+        self.assertEqual(manager.delete_live([second, second]), 1)
+        self.assertEqual([e for e in manager.get_entries() if e['ID'] == 'key1'], [first])
+        self.assertFalse(manager.update_live(second, {'title': 'Gone'}))
+
+    def test_find_incomplete_tells_apart_entries_sharing_an_id(self):
+        with open(self.test_file, 'a') as f:
+            f.write('@article{key1,\n    title = {Another Paper},\n    journal = {Nature},\n    year = {2020}\n}\n')
+        manager = BibManager(self.test_file, use_cache=False)
+        first, second = [r for r in manager.find_incomplete() if r.ID == 'key1']
+        self.assertIsNot(first.entry, second.entry)
+        self.assertEqual((first.entry['title'], first.issues), ('A Very Important Paper', ('missing journal',)))
+        self.assertEqual((second.entry['title'], second.issues), ('Another Paper', ('missing author/editor',)))
 
 if __name__ == '__main__':
     unittest.main()
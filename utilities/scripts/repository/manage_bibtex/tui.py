@@ -1,15 +1,30 @@
 import sys
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from textual import work
+from textual.worker import get_current_worker
 from textual.app import App, ComposeResult
 from textual.containers import Horizontal, Vertical, VerticalScroll, Center
-from textual.widgets import Header, Footer, DataTable, Input, Button, Label, Static, Checkbox, DirectoryTree
+from textual.widgets import Header, Footer, Input, Button, Label, Static, Checkbox, DirectoryTree
 from textual.screen import ModalScreen, Screen
 from textual.binding import Binding
 from textual.message import Message
+from rich.text import Text
 
+from bib_table import BibTable
 from models import BibManager
 
+# Rows handed from the loading thread to the table at a time
+LOAD_BATCH_SIZE = 500
+
+# Seconds without typing before a search or threshold change is applied
+REFRESH_DEBOUNCE = 0.25
+
+# Row between two groups of the duplicates view
+GROUP_SEPARATOR = {"ID": "\33[31m>>> DUPLICATE GROUP SEPARATOR <<<", "ENTRYTYPE": "", "title": ""}
+
 
 
 
@@ -133,11 +148,13 @@ class DuplicateGroupModal(ModalScreen[dict]):
         yield Vertical(
             Label("Manage Duplicate Group", id="modal-title"),
             VerticalScroll(
-                *[Checkbox(f"{e.get('ID')} - {e.get('title', '')[:40]}...", id=f"chk_{e.get('ID')}") for e in self.group],
+                # Members may share an ID, so checkboxes are keyed by position
+                *[Checkbox(f"{e.get('ID')} - {e.get('title', '')[:40]}...", id=f"chk_{i}") for i, e in enumerate(self.group)],
                 id="modal-content"
             ),
             Horizontal(
                 Button("Delete Selected", variant="error", id="btn-delete-selected"),
+                Button("Merge Group", variant="success", id="btn-merge-group"),
                 Button("Cancel", variant="primary", id="btn-cancel"),
                 id="modal-buttons"
             ),
@@ -145,13 +162,15 @@ class DuplicateGroupModal(ModalScreen[dict]):
         )
 
     def on_mount(self) -> None:
-        for e in self.group:
-            self.checkboxes[e.get('ID')] = self.query_one(f"#chk_{e.get('ID')}", Checkbox)
+        for i in range(len(self.group)):
+            self.checkboxes[i] = self.query_one(f"#chk_{i}", Checkbox)
 
     def on_button_pressed(self, event: Button.Pressed) -> None:
         if event.button.id == "btn-delete-selected":
-            to_delete = [e_id for e_id, cb in self.checkboxes.items() if cb.value]
-            self.dismiss({"action": "delete_multiple", "ids": to_delete})
+            to_delete = [self.group[i] for i, cb in self.checkboxes.items() if cb.value]
+            self.dismiss({"action": "delete_multiple", "entries": to_delete})
+        elif event.button.id == "btn-merge-group":
+            self.dismiss({"action": "merge_group"})
         else:
             self.dismiss({"action": "cancel"})
 
@@ -172,7 +191,7 @@ class BibApp(App):
         align: center middle;
     }
     
-    DataTable {
+    BibTable {
         height: 1fr;
     }
     
@@ -243,6 +262,7 @@ class BibApp(App):
     BINDINGS = [
         ("q", "quit", "Quit"),
         ("s", "save", "Save Changes"),
+        ("m", "merge_all", "Merge All Duplicates"),
     ]
 
     def __init__(self):
@@ -251,13 +271,24 @@ class BibApp(App):
         self.bib_path = None
         self.current_filter = "all"
         self.search_term = ""
-        self.duplicate_reasons = {}
+        self.row_reasons = {}
         self.duplicate_groups = [] # Track the full groups here
         self.sim_threshold = 85.0  # Default threshold
+        self.loading = False
+        self.rows = {} # Row key -> (entry, reason) for the rows in the table
+        self.table_filter = None # Filter the table's cached cells were made for
+        self.table_stale = False # Entries changed since the rows were built
+        self.refresh_generation = 0 # Only the latest refresh gets applied
+        self.refresh_timer = None
+        # The manager and its indexes are not thread-safe: everything using
+        # them runs on one thread (see run_managed), which shares this lock
+        # with the loading thread
+        self.manager_lock = threading.Lock()
+        self.manager_tasks = ThreadPoolExecutor(max_workers=1, thread_name_prefix="manager")
     
     def compose(self) -> ComposeResult:
         yield Header()
-        yield Input(placeholder="Search by ID, Title, or Author...", id="search-bar")
+        yield Input(placeholder="Search all fields, or field:word (author:smith year:2020)...", id="search-bar")
         yield Horizontal(
             Button("Show All", id="filter-all", variant="primary"),
             Button("Show Duplicates", id="filter-duplicates", variant="warning"),
@@ -270,109 +301,204 @@ class BibApp(App):
             Button("Save", id="btn-save", variant="success"),
             id="action-bar"
         )
-        yield DataTable(id="bib-table")
+        yield BibTable(
+            [("ID", 24), ("Type", 13), ("Title", 53), ("Author", 33), ("Year", 4), ("Reason", 0)],
+            self.row_cells,
+            id="bib-table",
+        )
         yield Footer()
 
     def on_mount(self) -> None:
-        # Just set up the table and show the picker
-        table = self.query_one(DataTable)
-        table.add_columns("ID", "Type", "Title", "Author", "Year", "Reason") 
-        table.cursor_type = "row"
-        
         # Show the picker immediately
         self.push_screen(FilePickerScreen(), self.load_bib_file)
 
+    def on_unmount(self) -> None:
+        # Drop queued work; a task already running is left to finish
+        self.manager_tasks.shutdown(wait=False, cancel_futures=True)
+
     def load_bib_file(self, path: str) -> None:
         if path:
             self.bib_path = path
-            self.manager = BibManager(path)
-            self.refresh_table()
-            self.notify(f"Loaded: {os.path.basename(path)}")
-
-    def refresh_table(self) -> None:
+            self.manager = BibManager(path, streaming=True, autoload=False)
+            # Drop rows (and pending results) of anything shown before
+            self.refresh_generation += 1
+            self.rows = {}
+            self.query_one(BibTable).set_rows([])
+            self.loading = True
+            self.sub_title = f"Loading {os.path.basename(path)}..."
+            self.stream_bib_file(self.manager)
+
+    @work(thread=True, exclusive=True, group="load")
+    def stream_bib_file(self, manager: BibManager) -> None:
+        """Index the file in a thread, showing entries as they are found."""
+        worker = get_current_worker()
+        entries = manager.stream_entries()
+        batch = []
+        while not worker.is_cancelled:
+            # The generator appends to the manager, so each step holds the lock
+            with self.manager_lock:
+                entry = next(entries, None)
+            if entry is None:
+                break
+            batch.append(entry)
+            if len(batch) >= LOAD_BATCH_SIZE:
+                self.call_from_thread(self.append_loaded, batch)
+                batch = []
+        if worker.is_cancelled:
+            return # Another file was opened
+        self.call_from_thread(self.append_loaded, batch)
+        self.call_from_thread(self.finish_loading)
+
+    def append_loaded(self, entries: list) -> None:
+        # Filtered views are rebuilt once loading is done
+        if self.current_filter == "all" and not self.search_term:
+            row_keys = self.add_rows(entries, self.rows, self.row_reasons)
+            self.query_one(BibTable).append_rows(row_keys)
+
+    def finish_loading(self) -> None:
+        self.loading = False
+        self.sub_title = ""
+        # Rows appended while a search was being applied may be missing
+        self.refresh_table()
+        self.notify(f"Loaded: {os.path.basename(self.bib_path)}")
+
+    def schedule_refresh(self) -> None:
+        """Refresh once typing pauses for REFRESH_DEBOUNCE seconds."""
+        if self.refresh_timer is not None:
+            self.refresh_timer.stop()
+        self.refresh_timer = self.set_timer(REFRESH_DEBOUNCE, self.refresh_table)
+
+    def refresh_table(self, changed: bool = False) -> None:
+        """
+        Rebuild the row list in a worker; changed=True after entries were
+        edited or deleted. Earlier refreshes still running are cancelled and
+        their results ignored.
+        """
         if not self.manager:
             return
-
-        table = self.query_one(DataTable)
-        table.clear()
-        
+        if self.refresh_timer is not None:
+            self.refresh_timer.stop()
+            self.refresh_timer = None
+        self.table_stale = self.table_stale or changed
+        if self.loading:
+            # finish_loading refreshes; until then rows are appended as they load
+            return
+        self.refresh_generation += 1
+        self.sub_title = "Working..."
+        self.run_managed(self.compute_rows, self.refresh_generation, self.current_filter, self.search_term,
+                         self.sim_threshold)
+
+    def run_managed(self, task, *args, **kwargs) -> None:
+        """
+        Run task on the manager thread. Tasks run one at a time in the order
+        they were queued, holding manager_lock, so the manager is never used
+        by two threads at once and edits apply in the order they were made.
+        """
+        self.manager_tasks.submit(self._run_managed, task, *args, **kwargs)
+
+    def _run_managed(self, task, *args, **kwargs) -> None:
+        try:
+            with self.manager_lock:
+                task(*args, **kwargs)
+        except Exception as e:
+            self.call_from_thread(self.task_failed, e)
+
+    def task_failed(self, error: Exception) -> None:
+        if not self.loading:
+            self.sub_title = ""
+        self.notify(f"Failed: {error}", severity="error")
+
+    def compute_rows(self, generation: int, view: str, search_term: str, threshold: float) -> None:
+        """Build the rows of a view, on the manager thread (see run_managed)."""
+        if generation != self.refresh_generation:
+            return # Superseded while queued
         entries = []
-        self.duplicate_reasons = {}
-        self.duplicate_groups = []
+        groups = []
+        reasons = {} # id(entry) -> reason: entries sharing an ID get their own
         
-        if self.current_filter == "all":
+        if view == "all":
             entries = self.manager.get_entries()
-        elif self.current_filter == "incomplete":
-            entries = self.manager.find_incomplete()
-        elif self.current_filter == "duplicates":
+        elif view == "incomplete":
+            for record in self.manager.find_incomplete():
+                entries.append(record.entry)
+                reasons[id(record.entry)] = ", ".join(record.issues)
+        elif view == "duplicates":
             # Pass our dynamically tracked threshold to the models.py method
-            self.duplicate_groups, reasons = self.manager.find_duplicates(threshold=self.sim_threshold)
-            self.duplicate_reasons = reasons 
+            groups, group_reasons = self.manager.duplicate_groups(threshold=threshold)
             
-            for g in self.duplicate_groups:
+            for g in groups:
                 entries.extend(g)
-                entries.append({"ID": "\33[31m>>> DUPLICATE GROUP SEPARATOR <<<", "ENTRYTYPE": "", "title": ""})
+                entries.append(GROUP_SEPARATOR)
+                for e in g:
+                    reasons[id(e)] = group_reasons.get(e.get('ID'), "")
+        if generation != self.refresh_generation:
+            return
         
         # Apply search filter
-        if self.search_term and self.current_filter != "duplicates":
-            filtered = []
-            for e in entries:
-                text = (e.get("ID", "") + e.get("title", "") + e.get("author", "")).lower()
-                if self.search_term in text:
-                    filtered.append(e)
-            entries = filtered
-            
-        seen_keys = set()
+        if search_term and view != "duplicates":
+            entries = self.manager.search(entries, search_term)
+
+        rows = {}
+        row_keys = self.add_rows(entries, rows, reasons)
+        if generation == self.refresh_generation:
+            self.call_from_thread(self.apply_rows, generation, view, groups, reasons, rows, row_keys)
+
+    def apply_rows(self, generation: int, view: str, groups: list, reasons: dict, rows: dict, row_keys: list) -> None:
+        """Swap in the result of compute_rows, unless a newer refresh started."""
+        if generation != self.refresh_generation:
+            return
+        table = self.query_one(BibTable)
+        # Cells are reused across searches, not across views or edits
+        if self.table_stale or view != self.table_filter:
+            table.invalidate()
+            self.table_filter = view
+            self.table_stale = False
+        self.duplicate_groups = groups
+        self.row_reasons = reasons
+        self.rows = rows
+        table.set_rows(row_keys)
+        if not self.loading:
+            self.sub_title = ""
+
+    @staticmethod
+    def add_rows(entries: list, rows: dict, reasons: dict) -> list:
+        """Add entries to rows (row key -> (entry, reason)), returns their row keys."""
+        row_keys = []
         for e in entries:
             base_id = e.get('ID', '')
             row_key = base_id
             
             # Handle unique row keys for duplicate display
             counter = 1
-            while row_key in seen_keys:
+            while row_key in rows:
                 row_key = f"{base_id}__dup{counter}"
                 counter += 1
-            seen_keys.add(row_key)
             
             # DETERMINE THE REASON STRING
-            reason_str = ""
-            if self.current_filter == "duplicates":
-                reason_str = self.duplicate_reasons.get(base_id, "") if base_id != "---" else ""
-            elif self.current_filter == "incomplete":
-                reason_str = e.get('reason_incomplete', "")
-
-            table.add_row(
-                e.get('ID', ''), 
-                e.get('ENTRYTYPE', ''),
-                e.get('title', '')[:50] + ('...' if len(e.get('title', '')) > 50 else ''),
-                e.get('author', '')[:30] + ('...' if len(e.get('author', '')) > 30 else ''),
-                e.get('year', ''), 
-                reason_str, # This fills our 6th column
-                key=row_key
-            )
-
-    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
-        row_key = event.row_key.value
-        
-        entry_id = row_key.split("__dup")[0]
-        
-        if entry_id == "---":
-            return # Separator
-            
-        entry_data = None
-        for e in self.manager.get_entries():
-            if e.get("ID") == entry_id:
-                entry_data = e
-                break
-                
-        if entry_data:
-            self.push_screen(DetailModal(entry_data), self.handle_modal_result)
-            self.active_entry_id = entry_id
+            reason_str = reasons.get(id(e), "")
+
+            rows[row_key] = (e, reason_str)
+            row_keys.append(row_key)
+        return row_keys
+
+    def row_cells(self, row_key: str) -> tuple:
+        """Display cells of a row, only asked for when the row is drawn."""
+        e, reason_str = self.rows[row_key]
+        title = e.get('title', '')
+        author = e.get('author', '')
+        return (
+            Text.from_ansi(e.get('ID', '')), # Separators are colored
+            e.get('ENTRYTYPE', ''),
+            title[:50] + ('...' if len(title) > 50 else ''),
+            author[:30] + ('...' if len(author) > 30 else ''),
+            e.get('year', ''),
+            reason_str,
+        )
 
     def on_input_changed(self, event: Input.Changed) -> None:
         if event.input.id == "search-bar":
             self.search_term = event.value.lower()
-            self.refresh_table()
+            self.schedule_refresh()
         elif event.input.id == "input-threshold":
             # If the user clears the input, don't crash, just wait for a number
             if not event.value:
@@ -381,7 +507,7 @@ class BibApp(App):
                 val = float(event.value)
                 self.sim_threshold = val
                 if self.current_filter == "duplicates":
-                    self.refresh_table()
+                    self.schedule_refresh()
             except ValueError:
                 pass
 
@@ -398,24 +524,24 @@ class BibApp(App):
         elif event.button.id == "btn-save":
             self.action_save()
 
-    def on_data_table_row_selected(self, event: DataTable.RowSelected) -> None:
-        row_key = event.row_key.value
-        entry_id = row_key.split("__dup")[0]
-        if entry_id == "---":
+    def on_bib_table_row_selected(self, event: BibTable.RowSelected) -> None:
+        # The row's own entry: the manager belongs to the manager thread
+        entry_data = self.rows[event.row_key][0]
+        if entry_data is GROUP_SEPARATOR:
             return
             
-        self.active_entry_id = entry_id
+        self.active_entry = entry_data
+        self.active_entry_id = entry_data.get('ID')
 
         if self.current_filter == "duplicates":
-            target_group = next((g for g in self.duplicate_groups if any(e.get('ID') == entry_id for e in g)), None)
+            target_group = next((g for g in self.duplicate_groups if any(e is entry_data for e in g)), None)
             if target_group:
+                self.active_group = target_group
                 self.push_screen(DuplicateGroupModal(target_group), self.handle_modal_result)
                 return
 
         # Otherwise, open the single-entry Detail Modal
-        entry_data = next((e for e in self.manager.get_entries() if e.get("ID") == entry_id), None)
-        if entry_data:
-            self.push_screen(DetailModal(entry_data), self.handle_modal_result)
+        self.push_screen(DetailModal(entry_data), self.handle_modal_result)
 
     def handle_modal_result(self, result: dict) -> None:
         # Changed this to expect a dictionary instead of a raw string
@@ -423,34 +549,62 @@ class BibApp(App):
             return
 
         action = result.get("action")
+        # Act on the selected entries themselves: IDs are not unique
+        entry, entry_id = self.active_entry, self.active_entry_id
         
         if action == "delete":
-            self.manager.delete_entry(self.active_entry_id)
-            self.notify(f"Deleted entry {self.active_entry_id}")
-            self.refresh_table()
+            self.change_entries(lambda _: f"Deleted entry {entry_id}", self.manager.delete_live, [entry])
             
         elif action == "delete_multiple":
-            ids_to_delete = result.get("ids", [])
-            for d_id in ids_to_delete:
-                self.manager.delete_entry(d_id)
-            self.notify(f"Deleted {len(ids_to_delete)} entries.")
-            self.refresh_table()
+            to_delete = result.get("entries", [])
+            self.change_entries(lambda deleted: f"Deleted {deleted} entries.", self.manager.delete_live, to_delete)
+            
+        elif action == "merge_group":
+            self.change_entries(lambda record: f"Merged {', '.join(record.merged)} into {record.kept}.",
+                                self.manager.merge_group, self.active_group, threshold=self.sim_threshold)
             
         elif action == "open_edit":
             # Pass the data to the Edit modal
-            entry_data = next((e for e in self.manager.get_entries() if e.get("ID") == self.active_entry_id), None)
-            if entry_data:
-                self.push_screen(EditEntryModal(entry_data), self.handle_modal_result)
+            self.push_screen(EditEntryModal(self.active_entry), self.handle_modal_result)
                 
         elif action == "save_edit":
             new_data = result.get("data", {})
-            self.manager.update_entry(self.active_entry_id, new_data)
-            self.notify("Entry updated.")
-            self.refresh_table()
+            self.change_entries(lambda _: "Entry updated.", self.manager.update_live, entry, new_data)
+
+    def change_entries(self, describe, change, *args, **kwargs) -> None:
+        """Apply change(*args, **kwargs) on the manager thread, then report describe(its result) and refresh."""
+        def task():
+            message = describe(change(*args, **kwargs))
+            self.call_from_thread(self.entries_changed, message)
+        self.run_managed(task)
+
+    def entries_changed(self, message: str) -> None:
+        self.notify(message)
+        self.refresh_table(changed=True)
+
+    def action_merge_all(self) -> None:
+        if not self.manager or self.loading:
+            return
+        self.sub_title = "Merging duplicates..."
+        self.change_entries(
+            lambda records: f"Merged {sum(len(r.merged) for r in records)} duplicates into {len(records)} entries.",
+            self.merge_all, self.manager, self.sim_threshold)
+
+    @staticmethod
+    def merge_all(manager: BibManager, threshold: float) -> list:
+        # Scoring every pair can take a while on a large file
+        groups, _ = manager.duplicate_groups(threshold=threshold)
+        return manager.merge_groups(groups, threshold=threshold)
 
     def action_save(self) -> None:
-        self.manager.save()
-        self.notify("Bibliography saved to file.")
+        if self.loading:
+            self.notify("Still loading, try again in a moment.", severity="warning")
+            return
+        self.run_managed(self.save_file, self.manager)
+
+    def save_file(self, manager: BibManager) -> None:
+        manager.save()
+        self.call_from_thread(self.notify, "Bibliography saved to file.")
 
 if __name__ == "__main__":
     app = BibApp() 
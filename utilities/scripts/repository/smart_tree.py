@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 import os
 import sys
+import time
+import pickle
+import hashlib
 import argparse
 from pathlib import Path
 from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 # --- Configuration & Heuristics ---
 
@@ -32,6 +36,17 @@ ENV_MARKERS = {
     'Cargo.toml': None, # Don't stop at Cargo.toml, but maybe useful context? (Not used for stopping yet)
 }
 
+# Heuristic: a subdirectory holding an 'activate' script marks a virtual env
+VENV_SCRIPT_DIRS = {
+    'bin': '🐍 Python Virtual Env (Unix)',
+    'Scripts': '🐍 Python Virtual Env (Win)',
+}
+
+# Once a directory has more subdirectories than the fold threshold, only
+# the first FOLD_HEAD and the last FOLD_TAIL are shown
+FOLD_HEAD = 3
+FOLD_TAIL = 1 # Often valuable for time series / incremental backups
+
 # --- Styling ---
 
 class Style:
@@ -52,83 +67,223 @@ class Style:
             return f"{color_code}{text}{Style.RESET}"
         return text
 
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if size < 1024 or unit == 'TiB':
+            return f"{size} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
 # --- Core Logic ---
 
-def analyze_directory(path_obj, show_hidden=False):
+def file_usage(entries):
+    """
+    Bytes and number of the regular files (not symlinks) among entries, and
+    the (device, inode, size) of the hardlinked ones, which are left out of
+    the totals until _roll_up counts each of them once.
+    """
+    size = count = 0
+    hardlinks = []
+    for entry in entries:
+        try:
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            # Cached on the entry (and free on Windows)
+            st = entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
+        if st.st_nlink > 1:
+            hardlinks.append((st.st_dev, st.st_ino, st.st_size))
+        else:
+            size += st.st_size
+            count += 1
+    return size, count, hardlinks
+
+def measure_directory(path):
+    """
+    Usage (see file_usage) of a directory the tree does not enter (past
+    --depth, or stopped and hidden ones with --deep), and its subdirectories (symlinks not followed, like du).
+    """
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return 0, 0, [], []
+    subdirs = []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+        except OSError:
+            pass
+    return (*file_usage(entries), subdirs)
+
+def analyze_directory(path, show_hidden=False, sizes=False):
     """
     Analyzes a directory to determine:
     1. If it's a special environment (stop recursion).
     2. The summary of files inside it.
     3. The list of valid subdirectories to traverse.
+    4. With sizes, its usage: bytes and number of all its files, hidden
+       ones included (see file_usage), the hidden subdirectories left out of 3, and
+       the subdirectories of 3 that are symlinks (not counted, like du).
+
+    The directory is listed once with os.scandir, whose entries carry their
+    type, so neither the files nor the environment markers cost a stat each.
     """
     is_stop = False
     stop_label = ""
     
     # 1. Check Directory Name against Blocklist
-    if path_obj.name in STOP_DIRS:
+    name = os.path.basename(os.path.normpath(path))
+    if name in STOP_DIRS:
         is_stop = True
-        stop_label = STOP_DIRS[path_obj.name]
-
-    # 2. Check for Marker Files (e.g. pyvenv.cfg)
-    # Only check markers if we haven't already decided to stop
-    if not is_stop:
-        try:
-            # Quick check for venv markers without full iteration if possible
-            if (path_obj / 'pyvenv.cfg').exists():
-                is_stop = True
-                stop_label = ENV_MARKERS['pyvenv.cfg']
-            elif (path_obj / 'bin' / 'activate').exists():
-                is_stop = True
-                stop_label = "🐍 Python Virtual Env (Unix)"
-            elif (path_obj / 'Scripts' / 'activate').exists():
-                is_stop = True
-                stop_label = "🐍 Python Virtual Env (Win)"
-        except PermissionError:
-            pass
+        stop_label = STOP_DIRS[name]
 
-    # 3. Scan Content
+    # 2. Scan Content
     files_summary = ""
     subdirs = []
     
     try:
         # We scan the directory once
-        all_items = list(path_obj.iterdir())
-        
-        if not show_hidden:
-            files = [f for f in all_items if f.is_file() and not f.name.startswith('.')]
-            subdirs = [d for d in all_items if d.is_dir() and not d.name.startswith('.')]
+        with os.scandir(path) as it:
+            entries = list(it)
+    except PermissionError:
+        files_summary = Style.color("Permission Denied", Style.RED)
+        usage = (0, 0, [], [], set()) if sizes else None
+        return True, stop_label, files_summary, subdirs, usage # Cannot traverse anyway
+
+    # 3. Check for Marker Files (e.g. pyvenv.cfg) in the same listing
+    # Only check markers if we haven't already decided to stop
+    if not is_stop:
+        by_name = {entry.name: entry for entry in entries}
+        if 'pyvenv.cfg' in by_name and ENV_MARKERS.get('pyvenv.cfg'):
+            is_stop = True
+            stop_label = ENV_MARKERS['pyvenv.cfg']
         else:
-            files = [f for f in all_items if f.is_file()]
-            subdirs = [d for d in all_items if d.is_dir()]
+            for dir_name, label in VENV_SCRIPT_DIRS.items():
+                entry = by_name.get(dir_name)
+                # One stat, and only where there is a bin/ or Scripts/
+                if entry is not None and entry.is_dir() and os.path.exists(os.path.join(entry.path, 'activate')):
+                    is_stop = True
+                    stop_label = label
+                    break
+
+    files = []
+    dir_entries = []
+    hidden_dirs = []
+    linked_dirs = set()
+    for entry in entries:
+        try:
+            if not show_hidden and entry.name.startswith('.'):
+                if sizes and entry.is_dir(follow_symlinks=False):
+                    hidden_dirs.append(entry.path)
+                continue
+            if entry.is_dir():
+                dir_entries.append(entry)
+                if sizes and entry.is_symlink():
+                    linked_dirs.add(entry.path)
+            elif entry.is_file():
+                files.append(entry.name)
+        except OSError:
+            pass # Vanished or unreadable meanwhile
+    
+    # Sort subdirs for consistent tree display
+    dir_entries.sort(key=lambda d: d.name.lower())
+    subdirs = [d.path for d in dir_entries]
+
+    # Generate File Summary
+    if files:
+        ext_counts = Counter()
+        for name in files:
+            ext = os.path.splitext(name)[1].lower().lstrip('.')
+            if not ext:
+                # Handle Makefiles, Dockerfiles, dotfiles
+                if name.startswith('.'): ext = name # e.g. .gitignore
+                elif name.lower() in ['makefile', 'dockerfile', 'jenkinsfile']: ext = name
+                else: ext = 'no-ext'
+            ext_counts[ext] += 1
         
-        # Sort subdirs for consistent tree display
-        subdirs.sort(key=lambda s: s.name.lower())
-
-        # Generate File Summary
-        if files:
-            ext_counts = Counter()
-            for f in files:
-                ext = f.suffix.lower().lstrip('.')
-                if not ext:
-                    # Handle Makefiles, Dockerfiles, dotfiles
-                    name = f.name
-                    if name.startswith('.'): ext = name # e.g. .gitignore
-                    elif name.lower() in ['makefile', 'dockerfile', 'jenkinsfile']: ext = name
-                    else: ext = 'no-ext'
-                ext_counts[ext] += 1
-            
-            # Format: "3 py, 1 md"
-            # Sort by count descending
-            summary_parts = [f"{count} {ext}" for ext, count in ext_counts.most_common(4)]
-            if len(ext_counts) > 4:
-                summary_parts.append("...")
-            files_summary = ", ".join(summary_parts)
+        # Format: "3 py, 1 md"
+        # Sort by count descending
+        summary_parts = [f"{count} {ext}" for ext, count in ext_counts.most_common(4)]
+        if len(ext_counts) > 4:
+            summary_parts.append("...")
+        files_summary = ", ".join(summary_parts)
 
-    except PermissionError:
-        files_summary = Style.color("Permission Denied", Style.RED)
-        is_stop = True # Cannot traverse anyway
+    usage = (*file_usage(entries), hidden_dirs, linked_dirs) if sizes else None
+    return is_stop, stop_label, files_summary, subdirs, usage
+
+# --- Scan Cache ---
 
-    return is_stop, stop_label, files_summary, subdirs
+# Bump when the cached results change layout
+SCAN_CACHE_VERSION = 1
+
+# Directories changed this recently may change again within the same mtime
+# tick (coarse on some network filesystems), so they are not cached
+RACY_NS = 2 * 10**9
+
+class ScanCache:
+    """
+    analyze_directory results of the last run on the same root with the same
+    options, one pickle under $XDG_CACHE_HOME/smart_tree. A directory's result
+    is reused while it has the same inode, mtime and ctime (entries added,
+    removed or renamed, or permissions changed, update those), and so do its
+    bin/ and Scripts/, where a venv's 'activate' script would appear. A hit
+    costs one stat instead of a listing.
+
+    Sizes (--sizes) are not cached: writing to a file leaves its directory's
+    mtime alone.
+    """
+
+    def __init__(self, root, show_hidden=False, smart=True):
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        key = f"{os.path.abspath(root)}|{show_hidden}|{smart}"
+        self.path = os.path.join(base, 'smart_tree', hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pickle')
+        self.old = {}
+        self.new = {}
+        try:
+            with open(self.path, 'rb') as f:
+                payload = pickle.load(f)
+            if payload.get('version') == SCAN_CACHE_VERSION:
+                self.old = payload['dirs']
+        except Exception:
+            # Missing, unreadable or from an incompatible version: just rescan
+            pass
+
+    def analyze(self, path, show_hidden=False):
+        """analyze_directory(path, show_hidden), from the cache if path did not change."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return analyze_directory(path, show_hidden)
+        stamp = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_ctime_ns)
+        record = self.old.get(path)
+        if record is not None and record[0] == stamp and all(_mtime_ns(p) == m for p, m in record[2]):
+            self.new[path] = record
+            return record[1]
+
+        result = analyze_directory(path, show_hidden)
+        if time.time_ns() - st.st_mtime_ns > RACY_NS:
+            probes = tuple((d, _mtime_ns(d)) for d in result[3] if os.path.basename(d) in VENV_SCRIPT_DIRS)
+            self.new[path] = (stamp, result, probes)
+        return result
+
+    def save(self):
+        """Keep the directories of this run for the next one. Failures are ignored."""
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': SCAN_CACHE_VERSION, 'dirs': self.new}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        except (OSError, pickle.PicklingError):
+            pass
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
 
 def get_common_pattern(names):
     """
@@ -141,26 +296,138 @@ def get_common_pattern(names):
         return prefix
     return ""
 
-def print_tree(path, prefix="", is_last=True, depth=0, max_depth=10, fold_threshold=10, show_hidden=False):
-    path_obj = Path(path)
-    
-    # Analyze
-    is_stop, stop_label, files_summary, subdirs = analyze_directory(path_obj)
+class Node:
+    """A directory of the tree and, once scanned, what analyze_directory found in it."""
+    __slots__ = ('path', 'depth', 'is_stop', 'stop_label', 'files_summary', 'subdirs', 'children',
+                 'bytes', 'files', 'hardlinks', 'is_link')
+
+    def __init__(self, path, depth, is_link=False):
+        self.path = path
+        self.depth = depth
+        self.is_link = is_link # Shown, but left out of its parent's usage
+        self.children = None # Not recursed into
+        # Own usage while scanning, then of the whole subtree (--sizes)
+        self.bytes = 0
+        self.files = 0
+        self.hardlinks = []
+
+def shown_subdirs(subdirs, fold_threshold):
+    if len(subdirs) > fold_threshold:
+        return subdirs[:FOLD_HEAD] + subdirs[-FOLD_TAIL:]
+    return subdirs
+
+def scan_tree(path, max_depth=10, fold_threshold=10, show_hidden=False, jobs=None, sizes=False, deep=False,
+              cache=None):
+    """
+    Scans path and the subdirectories print_tree shows, sibling subtrees
+    concurrently on up to jobs threads (directory listings mostly wait on
+    the filesystem). Children are created in sorted order before they are
+    scanned, so the tree does not depend on which scan finishes first.
+
+    With sizes, folded directories are scanned too and every node ends up
+    with the bytes and files of its subtree, in the same walk, directories
+    past max_depth included. Without deep these leave out stopped and hidden
+    directories; with it, those are measured as well, like du.
+
+    Without sizes, a ScanCache can answer for the directories that did not
+    change since the last run.
+    """
+    root = Node(str(path), 0)
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    pending = {}
+
+    def scan(node):
+        if cache is not None and not sizes:
+            pending[pool.submit(cache.analyze, node.path, show_hidden)] = (node, False)
+        else:
+            pending[pool.submit(analyze_directory, node.path, show_hidden, sizes)] = (node, False)
+
+    def measure(path, owner):
+        pending[pool.submit(measure_directory, path)] = (owner, True)
+
+    try:
+        scan(root)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                node, measuring = pending.pop(future)
+                if measuring:
+                    size, count, hardlinks, subdirs = future.result()
+                    node.bytes += size
+                    node.files += count
+                    node.hardlinks += hardlinks
+                    for subdir in subdirs:
+                        measure(subdir, node)
+                    continue
+
+                node.is_stop, node.stop_label, node.files_summary, node.subdirs, usage = future.result()
+                enter = not node.is_stop and node.depth < max_depth
+                if sizes and (deep or not node.is_stop):
+                    node.bytes += usage[0]
+                    node.files += usage[1]
+                    node.hardlinks += usage[2]
+                linked = usage[4] if sizes else ()
+                # Directories past max_depth still count towards their parents
+                if sizes and not enter and (deep or not node.is_stop):
+                    for subdir in node.subdirs:
+                        if subdir not in linked:
+                            measure(subdir, node)
+                if sizes and deep:
+                    for subdir in usage[3]:
+                        measure(subdir, node)
+                if not enter:
+                    continue
+                node.children = [Node(subdir, node.depth + 1, subdir in linked) for subdir in node.subdirs]
+                for child in (node.children if sizes else shown_subdirs(node.children, fold_threshold)):
+                    scan(child)
+    finally:
+        # On Ctrl-C, do not wait for the queued scans
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if sizes:
+        _roll_up(root, set())
+    return root
+
+def _roll_up(node, seen):
+    # Hardlinked files count where they are first met in tree order, which
+    # keeps the totals independent of the scanning order
+    for dev, ino, size in node.hardlinks:
+        if (dev, ino) not in seen:
+            seen.add((dev, ino))
+            node.bytes += size
+            node.files += 1
+    node.hardlinks = None
+    for child in node.children or ():
+        # A symlinked directory is totalled on its own, as du would if given it
+        _roll_up(child, set() if child.is_link else seen)
+        if not child.is_link:
+            node.bytes += child.bytes
+            node.files += child.files
+
+def print_tree(node, prefix="", is_last=True, depth=0, fold_threshold=10, sizes=False, deep=False, by_size=False):
+    is_stop, stop_label, files_summary, subdirs = node.is_stop, node.stop_label, node.files_summary, node.subdirs
+    usage = Style.color(f"{format_size(node.bytes)}, {node.files} files", Style.CYAN)
     
     # --- Formatting the Line ---
     connector = "└── " if is_last else "├── "
     if depth == 0: connector = "" # Root
 
-    name_str = path_obj.name
-    if depth == 0: name_str = str(path_obj)
+    name_str = os.path.basename(node.path)
+    if depth == 0: name_str = node.path
 
     # Decorate Name
     if is_stop:
         display_name = Style.color(name_str, Style.YELLOW)
         meta = f"  [{Style.color(stop_label, Style.MAGENTA)}]"
+        # Only measured with --deep
+        if sizes and deep:
+            meta += f" {usage}"
     else:
         display_name = Style.color(name_str, Style.BLUE)
         meta_parts = []
+
+        if sizes:
+            meta_parts.append(usage)
         
         # File Summary
         if files_summary:
@@ -178,49 +445,52 @@ def print_tree(path, prefix="", is_last=True, depth=0, max_depth=10, fold_thresh
 
     # --- Recursion & Folding Logic ---
     
-    if is_stop or depth >= max_depth:
+    # Stopped, or at max depth (see scan_tree)
+    if node.children is None:
         return
 
     # Handle subdirectories
     count = len(subdirs)
+    children = node.children
+    if by_size:
+        # Heaviest first, the name order kept among equals
+        children = sorted(children, key=lambda c: c.bytes, reverse=True)
+    options = dict(fold_threshold=fold_threshold, sizes=sizes, deep=deep, by_size=by_size)
+    new_prefix = prefix + ("    " if is_last else "│   ")
     
     # Logic: If too many subdirectories, fold the middle
     if count > fold_threshold:
-        # Show first 3
-        head_count = 3
-        # Show last 1 (often valuable for time series / incremental backups)
-        tail_count = 1
-        
-        to_show_head = subdirs[:head_count]
-        to_show_tail = subdirs[-tail_count:]
-        hidden_dirs = subdirs[head_count:-tail_count]
+        # Show first FOLD_HEAD, then last FOLD_TAIL
+        to_show_head = children[:FOLD_HEAD]
+        to_show_tail = children[-FOLD_TAIL:]
+        hidden_dirs = children[FOLD_HEAD:-FOLD_TAIL]
         
         # Process Head
-        new_prefix = prefix + ("    " if is_last else "│   ")
-        for i, subdir in enumerate(to_show_head):
-            print_tree(subdir, new_prefix, is_last=False, depth=depth+1, max_depth=max_depth, fold_threshold=fold_threshold, show_hidden=show_hidden)
+        for child in to_show_head:
+            print_tree(child, new_prefix, is_last=False, depth=depth+1, **options)
         
         # Process Folded Middle
         hidden_count = len(hidden_dirs)
-        pattern = get_common_pattern([d.name for d in hidden_dirs])
+        pattern = get_common_pattern([os.path.basename(d.path) for d in hidden_dirs])
         
         desc = f"... {hidden_count} directories hidden"
         if pattern:
             desc += f" (mostly '{pattern}*')"
+        if sizes:
+            desc += f", {format_size(sum(d.bytes for d in hidden_dirs))} in {sum(d.files for d in hidden_dirs)} files"
             
         print(f"{new_prefix}├── {Style.color(desc, Style.GREY)}")
         
         # Process Tail
-        for i, subdir in enumerate(to_show_tail):
+        for i, child in enumerate(to_show_tail):
             # This is effectively the last child of the current node
-            print_tree(subdir, new_prefix, is_last=(i == len(to_show_tail)-1), depth=depth+1, max_depth=max_depth, fold_threshold=fold_threshold, show_hidden=show_hidden)
+            print_tree(child, new_prefix, is_last=(i == len(to_show_tail)-1), depth=depth+1, **options)
             
     else:
         # Standard processing
-        new_prefix = prefix + ("    " if is_last else "│   ")
-        for i, subdir in enumerate(subdirs):
+        for i, child in enumerate(children):
             is_last_child = (i == count - 1)
-            print_tree(subdir, new_prefix, is_last_child, depth=depth+1, max_depth=max_depth, fold_threshold=fold_threshold, show_hidden=show_hidden)
+            print_tree(child, new_prefix, is_last_child, depth=depth+1, **options)
 
 def main():
     parser = argparse.ArgumentParser(description="Smart Tree: Context-aware directory visualizer for developers.")
@@ -229,6 +499,11 @@ def main():
     parser.add_argument("--fold", "-f", type=int, default=12, help="Threshold to fold directories (default: 12)")
     parser.add_argument("--all", "-a", action="store_true", help="Do not hide/fold anything (disables smart features)")
     parser.add_argument("--hidden", action="store_true", help="Show hidden files and folders")
+    parser.add_argument("--sizes", "-s", action="store_true", help="Show the bytes and files under each directory, folded ones included")
+    parser.add_argument("--deep", action="store_true", help="With --sizes, also count stopped and hidden directories (like du)")
+    parser.add_argument("--sort-size", action="store_true", help="List subdirectories heaviest first (implies --sizes)")
+    parser.add_argument("--no-cache", action="store_true", help="Rescan every directory instead of reusing the unchanged ones from the last run")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="Directories scanned at once (default: CPUs + 4)")
     
     args = parser.parse_args()
     
@@ -242,11 +517,18 @@ def main():
         # Clear stop dirs to force recursion
         STOP_DIRS.clear()
         ENV_MARKERS.clear()
+        VENV_SCRIPT_DIRS.clear()
         fold_thresh = 999999
     else:
         fold_thresh = args.fold
 
-    print_tree(root_path, max_depth=args.depth, fold_threshold=fold_thresh, show_hidden=args.hidden)
+    sizes = args.sizes or args.sort_size
+    cache = None if args.no_cache or sizes else ScanCache(root_path, args.hidden, smart=not args.all)
+    tree = scan_tree(root_path, max_depth=args.depth, fold_threshold=fold_thresh, show_hidden=args.hidden,
+                     jobs=max(args.jobs, 1) if args.jobs else None, sizes=sizes, deep=args.deep, cache=cache)
+    if cache is not None:
+        cache.save()
+    print_tree(tree, fold_threshold=fold_thresh, sizes=sizes, deep=args.deep, by_size=args.sort_size)
 
 if __name__ == "__main__":
     try:
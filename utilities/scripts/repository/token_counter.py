@@ -1,24 +1,160 @@
 #!/usr/bin/env python3
 import argparse
+import codecs
+import glob
+import hashlib
+import http.client
+import io
+import ipaddress
+import json
+import os
+import re
+import socket
+import socketserver
+import sqlite3
+import stat
 import sys
-from transformers import AutoTokenizer, logging
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, HTTPServer
 
-# Suppress transformers warnings about tokenizers parallelism
-logging.set_verbosity_error()
+# Files tokenized per call of the (fast, multi-threaded) batch encoder
+DEFAULT_BATCH_SIZE = 64
 
-def count_and_optionally_output_tokens(file_path, model_name, output_tokens, no_special):
+# Files at least this large are tokenized chunk by chunk (see count_file_streaming)
+DEFAULT_STREAM_THRESHOLD = 32 * 1024 * 1024
+# Characters read at a time when streaming
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# Text encoded before and after each chunk, so that the chunk is tokenized
+# as in the whole file (no SentencePiece '▁' at its start, whitespace runs
+# across its ends kept whole)
+CHUNK_CONTEXT = 256
+
+# With --jobs, files at least this large per worker are split between workers
+PART_MIN_SIZE = 8 * 1024 * 1024
+
+# Token counts kept by TokenCountCache, least recently used ones go first
+DEFAULT_CACHE_ENTRIES = 1_000_000
+
+# Preferred places to split a text: before a line starting with a non-space
+# character, or failing that before a space between two words
+_LINE_CUT = re.compile(r'\n(?=\S)')
+_WORD_CUT = re.compile(r'\S(?= \S)')
+_LINE_CUT_BYTES = re.compile(rb'\n(?=\S)')
+
+
+def _hub_cache_dir():
+    """Where huggingface_hub keeps downloaded models, by its own rules."""
+    for var in ('HF_HUB_CACHE', 'HUGGINGFACE_HUB_CACHE'):
+        if os.environ.get(var):
+            return os.environ[var]
+    if os.environ.get('HF_HOME'):
+        return os.path.join(os.environ['HF_HOME'], 'hub')
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'huggingface', 'hub')
+
+
+def find_tokenizer_file(model_name):
     """
-    Counts tokens in a file using a specified tokenizer and optionally outputs them.
+    The tokenizer.json of a model directory, or of the model's latest
+    download in the Hugging Face cache, without importing huggingface_hub.
+
+    Returns:
+        str: Its path, or None if there is none.
+    """
+    if os.path.isdir(model_name):
+        path = os.path.join(model_name, 'tokenizer.json')
+        return path if os.path.isfile(path) else None
+    revision = _hub_revision(model_name)
+    if revision is None:
+        return None
+    path = os.path.join(_hub_repo_dir(model_name), 'snapshots', revision, 'tokenizer.json')
+    return path if os.path.isfile(path) else None
+
+
+def _hub_repo_dir(model_name):
+    return os.path.join(_hub_cache_dir(), 'models--' + model_name.replace('/', '--'))
+
+
+def _hub_revision(model_name):
+    """The commit of the model's latest download in the Hugging Face cache, None if it has none."""
+    try:
+        with open(os.path.join(_hub_repo_dir(model_name), 'refs', 'main'), encoding='utf-8') as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+class SerializedTokenizer:
+    """
+    A `tokenizers` Tokenizer loaded from tokenizer.json, with the part of the
+    transformers tokenizer interface this script uses.
+    """
+    is_fast = True
+
+    def __init__(self, path):
+        from tokenizers import Tokenizer
+        self.backend = Tokenizer.from_file(path)
+        # Counting needs every token, whatever the model's maximum length
+        self.backend.no_truncation()
+        self.backend.no_padding()
+
+    def __call__(self, text, add_special_tokens=True, return_offsets_mapping=False, **kwargs):
+        texts = [text] if isinstance(text, str) else text
+        encodings = self.backend.encode_batch(texts, add_special_tokens=add_special_tokens)
+        encoded = {"input_ids": [e.ids for e in encodings]}
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = [e.offsets for e in encodings]
+        if isinstance(text, str):
+            encoded = {key: value[0] for key, value in encoded.items()}
+        return encoded
+
+    def num_special_tokens_to_add(self, pair=False):
+        processor = self.backend.post_processor
+        return processor.num_special_tokens_to_add(pair) if processor is not None else 0
+
+    def convert_ids_to_tokens(self, ids):
+        return [self.backend.id_to_token(i) for i in ids]
+
+
+def load_tokenizer(model_name, quiet=False):
+    """
+    Loads the tokenizer of a model. A tokenizer.json in the model directory
+    or the local Hugging Face cache is read directly with `tokenizers`;
+    otherwise transformers resolves the model, preferring the fast (Rust)
+    implementation. Both imports wait until here, so --help and cached counts
+    never pay for them. With HF_HUB_OFFLINE=1 (--offline), only local files
+    are used.
 
     Args:
-        file_path (str): Path to the text file.
-        model_name (str): Hugging Face model name for the tokenizer.
-        output_tokens (bool): If True, print the tokenized output.
-        no_special (bool): If True, exclude special tokens from the count and output.
+        model_name (str): Hugging Face model name or local directory of the tokenizer.
+        quiet (bool): If True, do not announce the tokenizer (worker processes).
 
     Returns:
-        None: Prints output directly.
+        The tokenizer. Exits the script if it cannot be loaded.
     """
+    path = find_tokenizer_file(model_name)
+    if path is not None:
+        try:
+            tokenizer = SerializedTokenizer(path)
+            if not quiet:
+                print(f"--- Using tokenizer: {model_name} ---", file=sys.stderr)
+            return tokenizer
+        except Exception as e:
+            # Missing library or a tokenizer.json it cannot read: let transformers try
+            print(f"Warning: Could not read '{path}' ({e}), loading through transformers.", file=sys.stderr)
+
+    try:
+        from transformers import AutoTokenizer, logging
+    except ImportError:
+        print("The 'transformers' library is required. Please install it:", file=sys.stderr)
+        print("pip install transformers torch # or tensorflow", file=sys.stderr)
+        sys.exit(1)
+    # Suppress transformers warnings about tokenizers parallelism
+    logging.set_verbosity_error()
+
     try:
         # Load the tokenizer for the specified model
         # use_fast=True is often faster, but fallback if needed
@@ -28,44 +164,880 @@ def count_and_optionally_output_tokens(file_path, model_name, output_tokens, no_
              print(f"Warning: Could not load fast tokenizer for '{model_name}'. Trying slow version.", file=sys.stderr)
              tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
 
-        print(f"--- Using tokenizer: {model_name} ---", file=sys.stderr)
+        if not quiet:
+            print(f"--- Using tokenizer: {model_name} ---", file=sys.stderr)
+        return tokenizer
 
     except Exception as e:
         print(f"Error loading tokenizer for model '{model_name}': {e}", file=sys.stderr)
-        print("Please check the model name, Hugging Face Hub connectivity, or required libraries.", file=sys.stderr)
+        if os.environ.get('HF_HUB_OFFLINE', '').lower() in ('1', 'true', 'yes', 'on'):
+            print("Offline mode: the model must already be in the local Hugging Face cache.", file=sys.stderr)
+        else:
+            print("Please check the model name, Hugging Face Hub connectivity, or required libraries.", file=sys.stderr)
         sys.exit(1)
 
+
+def collect_files(inputs, show_hidden=False):
+    """
+    Expands the command line inputs into a list of files.
+
+    Args:
+        inputs (list): File paths, directories (walked recursively) and glob
+            patterns (with '**' matching any number of directories).
+        show_hidden (bool): If True, also walk into hidden files and folders.
+
+    Returns:
+        tuple: (sorted list of unique file paths, list of inputs that matched nothing)
+    """
+    files = set()
+    unmatched = []
+    for item in inputs:
+        if os.path.isfile(item):
+            files.add(item)
+        elif os.path.isdir(item):
+            for root, dirs, names in os.walk(item):
+                if not show_hidden:
+                    dirs[:] = [d for d in dirs if not d.startswith('.')]
+                    names = [n for n in names if not n.startswith('.')]
+                files.update(os.path.join(root, n) for n in names)
+        else:
+            matches = [m for m in glob.glob(item, recursive=True) if os.path.isfile(m)]
+            if not matches:
+                unmatched.append(item)
+            files.update(matches)
+    return sorted(files), unmatched
+
+
+def _file_size(file_path):
+    try:
+        return os.path.getsize(file_path)
+    except OSError:
+        return 0
+
+
+def read_text(file_path):
+    """
+    Reads a file as UTF-8 text.
+
+    Returns:
+        tuple: (text, None) or (None, error message) if it cannot be read.
+    """
     try:
-        # Read the entire file content
         with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
-    except FileNotFoundError:
+            return f.read(), None
+    except UnicodeDecodeError:
+        return None, "not UTF-8 text"
+    except OSError as e:
+        return None, e.strerror or str(e)
+
+
+def encode_batch(tokenizer, texts, no_special):
+    """
+    Tokenizes several texts in one call, which fast tokenizers spread over
+    all cores.
+
+    Returns:
+        list: The token IDs of each text.
+    """
+    # `add_special_tokens` is controlled by the `no_special` flag's inverse
+    encoded = tokenizer(
+        texts,
+        add_special_tokens=not no_special,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+    )
+    return encoded["input_ids"]
+
+
+def _safe_cut(text, start, end):
+    """
+    Index of the last safe place to split text between start and end, or None.
+    """
+    for pattern in (_LINE_CUT, _WORD_CUT):
+        cut = None
+        for m in pattern.finditer(text, start, end):
+            cut = m.end()
+        if cut is not None:
+            return cut
+    return None
+
+
+def _count_segment(tokenizer, context, segment, lookahead=""):
+    """
+    Tokens of segment (no special tokens) when it sits between context and
+    lookahead in a text. Only fast tokenizers report offsets; a slow one
+    encodes segment alone.
+    """
+    if not tokenizer.is_fast:
+        return len(tokenizer(segment, add_special_tokens=False, return_attention_mask=False)["input_ids"])
+    encoded = tokenizer(
+        context + segment + lookahead,
+        add_special_tokens=False,
+        return_attention_mask=False,
+        return_offsets_mapping=True,
+    )
+    # A token is counted with the segment it starts in
+    start, end = len(context), len(context) + len(segment)
+    return sum(1 for offset, _ in encoded["offset_mapping"] if start <= offset < end)
+
+
+def count_file_streaming(tokenizer, file_path, no_special, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Counts the tokens of a file of any size with bounded memory.
+
+    The file is read chunk_size characters at a time and split before a line
+    starting with a non-space character (or, on very long lines, before the
+    space between two words). Each segment is encoded between the last
+    CHUNK_CONTEXT characters before it and the first CHUNK_CONTEXT after
+    it, and only the tokens starting inside the segment are counted, so
+    words and whitespace runs across a split are tokenized as in the whole
+    file.
+
+    With a fast tokenizer the total is the same as encoding the whole file
+    at once. It can only be off by a token or two at a split through a
+    stretch of more than CHUNK_CONTEXT characters without a space, which is
+    only made when no line or word boundary was found in 4 * chunk_size
+    characters. Slow tokenizers (no offsets) encode every segment on its
+    own and can be off by one token per segment.
+
+    Returns:
+        int: The token count, special tokens included unless no_special.
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        total = _count_pieces(tokenizer, iter(lambda: f.read(chunk_size), ''), chunk_size)
+    if not no_special:
+        total += tokenizer.num_special_tokens_to_add(pair=False)
+    return total
+
+
+def _count_pieces(tokenizer, pieces, chunk_size, context="", lookahead=""):
+    """
+    Tokens (no special tokens) of the text made of pieces, coming between
+    context and lookahead. See count_file_streaming.
+    """
+    total = 0
+    pending = ""
+    for piece in pieces:
+        pending += piece
+        if len(pending) < 2 * chunk_size:
+            continue
+        # Cut in the first half, the rest is the lookahead and the next segment
+        cut = _safe_cut(pending, 0, chunk_size)
+        if cut is None:
+            if len(pending) < 4 * chunk_size:
+                continue
+            cut = chunk_size
+        segment, pending = pending[:cut], pending[cut:]
+        total += _count_segment(tokenizer, context, segment, pending[:CHUNK_CONTEXT])
+        context = segment[-CHUNK_CONTEXT:]
+    return total + _count_segment(tokenizer, context, pending, lookahead)
+
+
+def count_files(tokenizer, file_paths, no_special, batch_size=DEFAULT_BATCH_SIZE, keep_ids=False,
+                stream_threshold=DEFAULT_STREAM_THRESHOLD, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Counts the tokens of every file, tokenizing them batch_size at a time.
+
+    Args:
+        tokenizer: Tokenizer from load_tokenizer.
+        file_paths (list): Files to count.
+        no_special (bool): If True, exclude special tokens from the counts.
+        batch_size (int): Files read and tokenized together.
+        keep_ids (bool): If True, also return the token IDs of each file.
+        stream_threshold (int): Files of this many bytes or more are counted
+            with count_file_streaming instead (not when keep_ids).
+        chunk_size (int): Characters read at a time when streaming.
+
+    Returns:
+        list: One dict per file with 'path' and either 'tokens' (the count,
+        plus 'ids' if keep_ids) or 'error'.
+    """
+    results = []
+    for start in range(0, len(file_paths), batch_size):
+        batch = []
+        for file_path in file_paths[start:start + batch_size]:
+            result = {'path': file_path}
+            results.append(result)
+            if not keep_ids and _file_size(file_path) >= stream_threshold:
+                try:
+                    result['tokens'] = count_file_streaming(tokenizer, file_path, no_special, chunk_size)
+                except UnicodeDecodeError:
+                    result['error'] = "not UTF-8 text"
+                except OSError as e:
+                    result['error'] = e.strerror or str(e)
+                if 'error' in result:
+                    print(f"Warning: Skipping '{file_path}': {result['error']}", file=sys.stderr)
+                continue
+
+            text, error = read_text(file_path)
+            if error:
+                print(f"Warning: Skipping '{file_path}': {error}", file=sys.stderr)
+                result['error'] = error
+            else:
+                batch.append((result, text))
+
+        if batch:
+            token_ids = encode_batch(tokenizer, [text for _, text in batch], no_special)
+            for (result, _), ids in zip(batch, token_ids):
+                result['tokens'] = len(ids)
+                if keep_ids:
+                    result['ids'] = ids
+    return results
+
+
+# --- Worker pool (--jobs) ---
+
+# Tokenizer of a worker process, loaded once by _init_worker
+_worker_tokenizer = None
+
+
+def _init_worker(model_name):
+    global _worker_tokenizer
+    # One process per core already, the tokenizer's own threads would compete
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        _worker_tokenizer = load_tokenizer(model_name, quiet=True)
+    except SystemExit:
+        # load_tokenizer explained why; end the worker without a traceback
+        os._exit(1)
+
+
+def _count_files_task(file_paths, no_special, keep_ids, chunk_size):
+    return count_files(_worker_tokenizer, file_paths, no_special, len(file_paths), keep_ids,
+                       stream_threshold=float('inf'), chunk_size=chunk_size)
+
+
+def _decode_edge(data):
+    return data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _read_part(f, start, end, chunk_size):
+    """
+    Text of bytes start to end of f, chunk_size bytes at a time, decoded as
+    open(..., 'r', encoding='utf-8') would.
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+    f.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        data = f.read(min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield decoder.decode(data, final=remaining <= 0)
+
+
+def _count_part_task(file_path, start, end, add_special, chunk_size):
+    """
+    Tokens of bytes start to end of a file, tokenized with the text around
+    them as context (see count_file_streaming).
+    """
+    edge = 4 * CHUNK_CONTEXT
+    with open(file_path, 'rb') as f:
+        f.seek(max(start - edge, 0))
+        context = _decode_edge(f.read(start - max(start - edge, 0)))[-CHUNK_CONTEXT:]
+        f.seek(end)
+        lookahead = _decode_edge(f.read(edge))[:CHUNK_CONTEXT]
+        count = _count_pieces(_worker_tokenizer, _read_part(f, start, end, chunk_size), chunk_size,
+                              context, lookahead)
+    if add_special:
+        count += _worker_tokenizer.num_special_tokens_to_add(pair=False)
+    return count
+
+
+def _split_points(file_path, size, parts):
+    """
+    Byte offsets cutting a file into about `parts` parts, each one starting
+    a line that starts with a non-space character.
+    """
+    points = [0]
+    with open(file_path, 'rb') as f:
+        for k in range(1, parts):
+            target = max(size * k // parts, points[-1])
+            f.seek(target)
+            m = _LINE_CUT_BYTES.search(f.read(DEFAULT_CHUNK_SIZE))
+            if m and target + m.end() < size:
+                points.append(target + m.end())
+    points.append(size)
+    return sorted(set(points))
+
+
+def count_files_parallel(model_name, file_paths, no_special, jobs, batch_size=DEFAULT_BATCH_SIZE,
+                         keep_ids=False, stream_threshold=DEFAULT_STREAM_THRESHOLD,
+                         chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Same as count_files, spread over `jobs` processes that each load the
+    tokenizer once. Small files are sent batch_size at a time; files of
+    stream_threshold bytes or more are cut at line boundaries into up to
+    `jobs` parts of at least PART_MIN_SIZE bytes, counted by several workers
+    and added up here.
+
+    Returns:
+        list: One dict per file, as count_files.
+    """
+    results = [{'path': file_path} for file_path in file_paths]
+    small = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(model_name,)) as pool:
+        parts = []
+        for result in results:
+            file_path = result['path']
+            size = _file_size(file_path)
+            if keep_ids or size < stream_threshold:
+                small.append(result)
+                continue
+            points = _split_points(file_path, size, max(1, min(jobs, size // PART_MIN_SIZE)))
+            futures = [
+                pool.submit(_count_part_task, file_path, start, end, start == 0 and not no_special, chunk_size)
+                for start, end in zip(points, points[1:])
+            ]
+            parts.append((result, futures))
+
+        batches = []
+        for start in range(0, len(small), batch_size):
+            batch = small[start:start + batch_size]
+            future = pool.submit(_count_files_task, [r['path'] for r in batch], no_special, keep_ids, chunk_size)
+            batches.append((batch, future))
+
+        for result, futures in parts:
+            try:
+                result['tokens'] = sum(future.result() for future in futures)
+            except UnicodeDecodeError:
+                result['error'] = "not UTF-8 text"
+            except OSError as e:
+                result['error'] = e.strerror or str(e)
+            if 'error' in result:
+                print(f"Warning: Skipping '{result['path']}': {result['error']}", file=sys.stderr)
+        for batch, future in batches:
+            for result, counted in zip(batch, future.result()):
+                result.update(counted)
+    return results
+
+
+def print_tokens(tokenizer, result):
+    # Decode tokens for printing (more human-readable than IDs)
+    # Using convert_ids_to_tokens provides a list of token strings;
+    # a server (--client) sends them already decoded
+    if 'token_strings' in result:
+        tokens_list = result['token_strings']
+    else:
+        tokens_list = tokenizer.convert_ids_to_tokens(result['ids'])
+    # Print tokens separated by space for readability
+    print(" ".join(tokens_list))
+    print("--------------")
+
+
+def print_report(results, model_name, no_special, as_json=False):
+    """
+    Prints the per-file and total token counts, as an aligned table or as JSON.
+    """
+    counted = [r for r in results if 'tokens' in r]
+    total = sum(r['tokens'] for r in counted)
+
+    if as_json:
+        report = {
+            'model': model_name,
+            'special_tokens': not no_special,
+            'files': [{k: v for k, v in r.items() if k != 'ids'} for r in results],
+            'total': total,
+        }
+        print(json.dumps(report, indent=2))
+        return
+
+    width = max(len(str(total)), 6)
+    for r in results:
+        count = str(r['tokens']) if 'tokens' in r else "-"
+        print(f"{count:>{width}}  {r['path']}")
+    print(f"{total:>{width}}  TOTAL ({len(counted)} files)")
+
+
+# --- Count cache ---
+
+def file_digest(file_path):
+    """BLAKE2b digest of a file's content."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def tokenizer_identity(model_name):
+    """
+    The model name and the version of its tokenizer: the digest of the
+    tokenizer.json it is read from, of the files of a model directory
+    transformers loads, or the revision of its download. Counts are cached
+    under it, so those made before the tokenizer changed are not reused.
+    """
+    path = find_tokenizer_file(model_name)
+    if path is not None:
+        return f"{model_name}@{file_digest(path)}"
+    if os.path.isdir(model_name):
+        with os.scandir(model_name) as it:
+            files = sorted((e.name, e.stat().st_size, e.stat().st_mtime_ns) for e in it if e.is_file())
+        return f"{model_name}@{hashlib.blake2b(repr(files).encode(), digest_size=20).hexdigest()}"
+    revision = _hub_revision(model_name)
+    return f"{model_name}@{revision}" if revision else model_name
+
+
+class TokenCountCache:
+    """
+    Token counts of file contents already counted, in an SQLite database
+    under $XDG_CACHE_HOME/token_counter, keyed by (content digest, tokenizer
+    (see tokenizer_identity), special tokens). Only the max_entries most recently used counts
+    are kept.
+    """
+    # Digests looked up per query
+    LOOKUP_BATCH = 500
+
+    def __init__(self, path=None, max_entries=DEFAULT_CACHE_ENTRIES):
+        if path is None:
+            base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+            path = os.path.join(base, 'token_counter', 'counts.sqlite')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        # Several runs may share the cache; WAL lets them read while one writes
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS counts ("
+            " digest TEXT, model TEXT, special INTEGER, tokens INTEGER NOT NULL, used REAL NOT NULL,"
+            " PRIMARY KEY (digest, model, special)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS counts_used ON counts (used)")
+
+    def get_many(self, digests, tokenizer_key, special):
+        """
+        Returns:
+            dict: digest -> token count, for the digests in the cache.
+        """
+        digests = list(digests)
+        found = {}
+        with self.db:
+            for start in range(0, len(digests), self.LOOKUP_BATCH):
+                batch = digests[start:start + self.LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                found.update(self.db.execute(
+                    f"SELECT digest, tokens FROM counts WHERE model = ? AND special = ? AND digest IN ({marks})",
+                    [tokenizer_key, special, *batch],
+                ))
+            self.db.executemany(
+                "UPDATE counts SET used = ? WHERE digest = ? AND model = ? AND special = ?",
+                [(time.time(), digest, tokenizer_key, special) for digest in found],
+            )
+        return found
+
+    def put_many(self, counts, tokenizer_key, special):
+        """Stores counts (digest -> token count), then evicts the least recently used."""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO counts VALUES (?, ?, ?, ?, ?)",
+                [(digest, tokenizer_key, special, tokens, now) for digest, tokens in counts.items()],
+            )
+            excess = self.db.execute("SELECT COUNT(*) FROM counts").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self.db.execute(
+                    "DELETE FROM counts WHERE (digest, model, special) IN"
+                    " (SELECT digest, model, special FROM counts ORDER BY used LIMIT ?)",
+                    (excess,),
+                )
+
+    def close(self):
+        self.db.close()
+
+
+def count_and_optionally_output_tokens(file_path, model_name, output_tokens, no_special, stream=False,
+                                       chunk_size=DEFAULT_CHUNK_SIZE, jobs=1, cache=None, server=None):
+    """
+    Counts tokens in a file using a specified tokenizer and optionally outputs them.
+
+    Args:
+        file_path (str): Path to the text file.
+        model_name (str): Hugging Face model name for the tokenizer.
+        output_tokens (bool): If True, print the tokenized output.
+        no_special (bool): If True, exclude special tokens from the count and output.
+        stream (bool): If True, tokenize the file chunk by chunk (see count_file_streaming).
+        chunk_size (int): Characters read at a time when streaming.
+        jobs (int): Processes sharing the work on a large file (see count_files_parallel).
+        cache (TokenCountCache): If given, where to look up and store the count.
+        server (str): If given, address of a --serve process counting in our place.
+
+    Returns:
+        None: Prints output directly.
+    """
+    if not os.path.isfile(file_path):
         print(f"Error: File not found at '{file_path}'", file=sys.stderr)
         sys.exit(1)
-    except Exception as e:
-        print(f"Error reading file '{file_path}': {e}", file=sys.stderr)
-        sys.exit(1)
 
-    # Tokenize the text
-    # `add_special_tokens` is controlled by the `no_special` flag's inverse
-    token_ids = tokenizer.encode(text, add_special_tokens=not no_special)
-    token_count = len(token_ids)
+    if server is not None:
+        results, tokenizer = count_on_server(server, model_name, [file_path], no_special, output_tokens), None
+    else:
+        results, tokenizer = run_count(model_name, [file_path], no_special, jobs, keep_ids=output_tokens,
+                                       stream=stream, chunk_size=chunk_size, cache=cache)
+    result = results[0]
+    if 'error' in result:
+        print(f"Error reading file '{file_path}': {result['error']}", file=sys.stderr)
+        sys.exit(1)
 
-    print(f"Token Count: {token_count}")
+    print(f"Token Count: {result['tokens']}")
 
     if output_tokens:
-        # Decode tokens for printing (more human-readable than IDs)
-        # Using convert_ids_to_tokens provides a list of token strings
-        tokens_list = tokenizer.convert_ids_to_tokens(token_ids)
         print("\n--- Tokens ---")
-        # Print tokens separated by space for readability
-        print(" ".join(tokens_list))
-        print("--------------")
+        print_tokens(tokenizer, result)
+
+
+def run_count(model_name, file_paths, no_special, jobs=1, batch_size=DEFAULT_BATCH_SIZE, keep_ids=False,
+              stream=False, chunk_size=DEFAULT_CHUNK_SIZE, cache=None):
+    """
+    Counts file_paths in this process (jobs=1) or in a worker pool. With a
+    cache, files whose content was already counted with this tokenizer are
+    only hashed, and the tokenizer is not even loaded if they all were.
+
+    Returns:
+        tuple: (results as count_files returns them, the tokenizer if it was
+        loaded here, else None)
+    """
+    digests = {}
+    cached = {}
+    if cache is not None:
+        tokenizer_key = tokenizer_identity(model_name)
+        for file_path in file_paths:
+            try:
+                digests[file_path] = file_digest(file_path)
+            except OSError:
+                pass # Reported when counting
+        # Printing tokens needs them all, counts are still stored
+        if not keep_ids:
+            cached = cache.get_many(set(digests.values()), tokenizer_key, not no_special)
+        if cached:
+            hits = sum(digests.get(p) in cached for p in file_paths)
+            print(f"--- Token counts from cache: {hits}/{len(file_paths)} files ---", file=sys.stderr)
+
+    todo = [p for p in file_paths if digests.get(p) not in cached]
+    counted, tokenizer = _count_uncached(model_name, todo, no_special, jobs, batch_size, keep_ids,
+                                         stream, chunk_size) if todo else ([], None)
+
+    if cache is not None:
+        cache.put_many({digests[r['path']]: r['tokens'] for r in counted if 'tokens' in r and r['path'] in digests},
+                       tokenizer_key, not no_special)
+
+    counted = iter(counted)
+    results = []
+    for file_path in file_paths:
+        digest = digests.get(file_path)
+        results.append({'path': file_path, 'tokens': cached[digest]} if digest in cached else next(counted))
+    return results, tokenizer
+
+
+def _count_uncached(model_name, file_paths, no_special, jobs, batch_size, keep_ids, stream, chunk_size):
+    stream_threshold = 0 if stream else DEFAULT_STREAM_THRESHOLD
+    if jobs <= 1:
+        tokenizer = load_tokenizer(model_name)
+        return count_files(tokenizer, file_paths, no_special, batch_size, keep_ids,
+                           stream_threshold, chunk_size), tokenizer
+
+    print(f"--- Using tokenizer: {model_name} ({jobs} processes) ---", file=sys.stderr)
+    try:
+        results = count_files_parallel(model_name, file_paths, no_special, jobs, batch_size, keep_ids,
+                                       stream_threshold, chunk_size)
+    except BrokenProcessPool:
+        print("Error: Worker processes failed (see above).", file=sys.stderr)
+        sys.exit(1)
+    # Printing tokens needs the tokenizer here too, loaded once the workers are gone
+    return results, load_tokenizer(model_name, quiet=True) if keep_ids else None
+
+
+# --- Server (--serve) and its client (--client) ---
+
+def parse_address(address):
+    """
+    A Unix socket path (anything with a '/' or ending in .sock), or
+    (host, port) for 'PORT' or 'HOST:PORT', the host defaulting to localhost.
+    """
+    if '/' in address or address.endswith('.sock'):
+        return address
+    host, _, port = address.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def _is_socket(path):
+    return os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode)
+
+
+def _is_loopback(host):
+    try:
+        infos = socket.getaddrinfo(host, None)
+    except socket.gaierror:
+        return False
+    return all(ipaddress.ip_address(info[4][0].split('%')[0]).is_loopback for info in infos)
+
+
+def check_serve_address(address, allow_remote=False):
+    """
+    Raises ValueError if --serve should not use address: a path holding
+    anything but a socket (which would be replaced), or a host other than
+    localhost without allow_remote. The server reads any file a request
+    names, so it is only reachable from this machine unless asked otherwise.
+    """
+    address = parse_address(address)
+    if isinstance(address, str):
+        if os.path.exists(address) and not _is_socket(address):
+            raise ValueError(f"'{address}' exists and is not a socket")
+    elif not allow_remote and not _is_loopback(address[0]):
+        raise ValueError(f"'{address[0]}' is not a loopback address (see --allow-remote)")
+
+
+class ResidentTokenizers:
+    """Tokenizers kept loaded by the server, loaded on first use of each model."""
+
+    def __init__(self):
+        self.loaded = {}
+        self.lock = threading.Lock()
+
+    def get(self, model_name):
+        tokenizer = self.loaded.get(model_name)
+        if tokenizer is None:
+            with self.lock:
+                tokenizer = self.loaded.get(model_name)
+                if tokenizer is None:
+                    try:
+                        tokenizer = load_tokenizer(model_name)
+                    except SystemExit:
+                        raise ValueError(f"Cannot load tokenizer '{model_name}'")
+                    self.loaded[model_name] = tokenizer
+        return tokenizer
+
+
+def answer(tokenizers, request, default_model):
+    """
+    Counts what a request asks for:
+
+        {"model": "gpt2", "no_special": false, "tokens": false,
+         "texts": ["...", ...]}   or   "paths": ["/abs/file", ...]
+
+    Texts get {"counts": [...]}, paths get {"files": [...]} with the records
+    of count_files. "tokens": true adds the token strings ("token_strings")
+    of every text or file.
+    """
+    if not isinstance(request, dict):
+        raise ValueError("Request must be a JSON object")
+    model_name = request.get('model') or default_model
+    no_special = bool(request.get('no_special'))
+    want_tokens = bool(request.get('tokens'))
+    tokenizer = tokenizers.get(model_name)
+    response = {'model': model_name, 'special_tokens': not no_special}
+
+    if 'texts' in request:
+        texts = request['texts']
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            raise ValueError("'texts' must be a list of strings")
+        ids = encode_batch(tokenizer, texts, no_special) if texts else []
+        response['counts'] = [len(i) for i in ids]
+        if want_tokens:
+            response['token_strings'] = [tokenizer.convert_ids_to_tokens(i) for i in ids]
+    elif 'paths' in request:
+        paths = request['paths']
+        if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+            raise ValueError("'paths' must be a list of strings")
+        results = count_files(tokenizer, paths, no_special, keep_ids=want_tokens)
+        for r in results:
+            if 'ids' in r:
+                r['token_strings'] = tokenizer.convert_ids_to_tokens(r.pop('ids'))
+        response['files'] = results
+    else:
+        raise ValueError("Request needs 'texts' or 'paths'")
+    return response
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """POST /count with a JSON request (see answer), GET /health."""
+
+    def _refused(self):
+        """
+        Replies with an error to requests a web page could make: a browser
+        sends the page's own Host, even after DNS rebinding pointed its
+        domain at this machine, and cannot POST JSON to another site
+        without the server agreeing (CORS).
+        """
+        allowed = self.server.allowed_hosts
+        if allowed is not None and self.headers.get('Host') not in allowed:
+            self._reply(403, {'error': f"Host not allowed: {self.headers.get('Host')}"})
+            return True
+        if self.command == 'POST':
+            content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type != 'application/json':
+                self._reply(415, {'error': "Content-Type must be application/json"})
+                return True
+        return False
+
+    def do_GET(self):
+        if self._refused():
+            return
+        if self.path != '/health':
+            self._reply(404, {'error': f"No such endpoint: {self.path}"})
+            return
+        self._reply(200, {'models': sorted(self.server.tokenizers.loaded)})
+
+    def do_POST(self):
+        if self._refused():
+            return
+        if self.path != '/count':
+            self._reply(404, {'error': f"No such endpoint: {self.path}"})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            response = answer(self.server.tokenizers, json.loads(body), self.server.default_model)
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        self._reply(200, response)
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Hundreds of requests a minute; errors still reach the client
+        pass
+
+
+class _PooledServer:
+    """Handles each connection on a thread of a fixed pool (fast tokenizers release the GIL)."""
+    # Bursts of clients wait in the listen queue rather than being refused
+    request_queue_size = 128
+    # Host headers accepted, None for any (see _RequestHandler._refused)
+    allowed_hosts = None
+
+    def setup_pool(self, threads, tokenizers, default_model):
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.tokenizers = tokenizers
+        self.default_model = default_model
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+
+
+class _TCPServer(_PooledServer, HTTPServer):
+    pass
+
+
+class _UnixServer(_PooledServer, socketserver.UnixStreamServer):
+    pass
+
+
+def serve(address, model_name, threads, allow_remote=False):
+    """
+    Answers count requests at address (see parse_address and
+    check_serve_address) until interrupted, with model_name loaded up front
+    and other models loaded when asked for.
+    """
+    check_serve_address(address, allow_remote)
+    tokenizers = ResidentTokenizers()
+    tokenizers.loaded[model_name] = load_tokenizer(model_name)
+    address = parse_address(address)
+    if isinstance(address, str):
+        # A socket left behind by a server that did not exit cleanly
+        if _is_socket(address):
+            os.remove(address)
+        server = _UnixServer(address, _RequestHandler)
+        where = address
+    else:
+        server = _TCPServer(address, _RequestHandler)
+        where = "http://%s:%d" % server.server_address[:2]
+        if not allow_remote:
+            port = server.server_address[1]
+            server.allowed_hosts = {f"{host}:{port}" for host in ('localhost', '127.0.0.1', '[::1]')}
+    server.setup_pool(threads, tokenizers, model_name)
+    print(f"--- Serving token counts on {where} ({threads} threads) ---", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(address, str) and _is_socket(address):
+            os.remove(address)
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path, timeout):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_server(address, request, timeout=600):
+    """
+    Sends a count request (see answer) to a --serve process.
+
+    Returns:
+        dict: Its response. Raises OSError, http.client.HTTPException or
+        ValueError if it cannot be had.
+    """
+    address = parse_address(address)
+    if isinstance(address, str):
+        connection = _UnixHTTPConnection(address, timeout)
+    else:
+        connection = http.client.HTTPConnection(*address, timeout=timeout)
+    try:
+        connection.request('POST', '/count', json.dumps(request), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        body = json.loads(response.read())
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise ValueError(body.get('error', f"HTTP {response.status}"))
+    return body
+
+
+def count_on_server(address, model_name, file_paths, no_special, keep_tokens=False):
+    """
+    Has a --serve process count file_paths.
+
+    Returns:
+        list: Results as count_files returns them, with the token strings
+        ("token_strings") instead of IDs. Exits the script if the server
+        cannot answer.
+    """
+    request = {
+        'model': model_name,
+        'paths': [os.path.abspath(p) for p in file_paths],
+        'no_special': no_special,
+        'tokens': keep_tokens,
+    }
+    try:
+        response = request_server(address, request)
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        print(f"Error: Token count server at '{address}' failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    # Reported with the paths as given
+    return [dict(r, path=p) for p, r in zip(file_paths, response['files'])]
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Count tokens in a text file using Hugging Face tokenizers.",
+        description="Count tokens in text files using Hugging Face tokenizers.",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog="""
 Examples:
@@ -73,13 +1045,19 @@ Examples:
   %(prog)s report.md -m bert-base-uncased
   %(prog)s code.py -m gpt2 -o
   %(prog)s data.txt --no-special-tokens
+  %(prog)s src/ docs/*.md            # per-file counts and a total
+  %(prog)s 'corpus/**/*.txt' --json  # quote globs to let the script expand them
+  %(prog)s corpus/ -j 0              # one worker process per CPU
+  %(prog)s --serve /tmp/tokens.sock  # keep the tokenizer loaded...
+  %(prog)s --client /tmp/tokens.sock notes.md  # ...and count through it
 """
     )
 
     parser.add_argument(
-        "file_path",
+        "file_paths",
         metavar="FILE",
-        help="Path to the text file to tokenize."
+        nargs="*",
+        help="Text files to tokenize. Directories are walked recursively and glob patterns are expanded."
     )
     parser.add_argument(
         "-m", "--model",
@@ -97,6 +1075,79 @@ Examples:
         action="store_true",
         help="Exclude special tokens (like [CLS], [SEP], <|endoftext|>) from the count and output."
     )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print per-file and total counts as JSON."
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Files tokenized together in one batch (default: {DEFAULT_BATCH_SIZE})."
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Tokenize every file chunk by chunk with bounded memory (files of "
+             f"{DEFAULT_STREAM_THRESHOLD // (1024 * 1024)} MiB or more always are). Not compatible with -o."
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"Characters read at a time when streaming (default: {DEFAULT_CHUNK_SIZE})."
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Worker processes, each loading the tokenizer once (default: 1, 0 for one per CPU)."
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not look up or store counts in the cache of already counted file contents."
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_ENTRIES,
+        help=f"Counts kept in the cache, least recently used ones are dropped first (default: {DEFAULT_CACHE_ENTRIES})."
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Never contact the Hugging Face Hub: load the tokenizer from a local directory or the local cache only."
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="ADDRESS",
+        help="Keep tokenizers loaded and answer count requests on a Unix socket (a path) "
+             "or over HTTP on localhost ('PORT' or 'HOST:PORT') instead of counting FILEs."
+    )
+    parser.add_argument(
+        "--allow-remote",
+        action="store_true",
+        help="Let --serve listen on a HOST other than localhost and accept any Host header. Anyone reaching it can read "
+             "any file the server can: only use this on a trusted network."
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Requests handled at once with --serve (default: one per CPU)."
+    )
+    parser.add_argument(
+        "--client",
+        metavar="ADDRESS",
+        help="Have the --serve process at ADDRESS count the FILEs (paths are sent, it reads them)."
+    )
+    parser.add_argument(
+        "--hidden",
+        action="store_true",
+        help="Include hidden files and folders when walking directories."
+    )
 
     if len(sys.argv) == 1:
         parser.print_help(sys.stderr)
@@ -104,18 +1155,73 @@ Examples:
 
     args = parser.parse_args()
 
-    # Install necessary libraries if missing
-    try:
-        import transformers
-    except ImportError:
-        print("The 'transformers' library is required. Please install it:", file=sys.stderr)
-        print("pip install transformers torch # or tensorflow", file=sys.stderr)
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count() or 1
+
+    for address in (args.serve, args.client):
+        if address is not None:
+            try:
+                parse_address(address)
+            except ValueError:
+                parser.error(f"invalid address '{address}': expected a socket path, PORT or HOST:PORT")
+
+    if args.serve:
+        try:
+            check_serve_address(args.serve, args.allow_remote)
+        except ValueError as e:
+            parser.error(f"cannot serve on '{args.serve}': {e}")
+        serve(args.serve, args.model, max(args.threads, 1), args.allow_remote)
+        sys.exit(0)
+    if not args.file_paths:
+        parser.error("the following arguments are required: FILE")
+
+    if args.stream and args.output_tokens:
+        parser.error("--output-tokens needs the whole token list, it cannot be used with --stream")
+
+    if args.offline:
+        # Read by huggingface_hub and transformers, and inherited by --jobs workers
+        os.environ["HF_HUB_OFFLINE"] = "1"
+
+    cache = None
+    if not args.no_cache and not args.client:
+        try:
+            cache = TokenCountCache(max_entries=max(args.cache_size, 1))
+        except (OSError, sqlite3.Error) as e:
+            print(f"Warning: Token count cache unavailable: {e}", file=sys.stderr)
+
+    # A single plain file keeps the original output
+    if len(args.file_paths) == 1 and os.path.isfile(args.file_paths[0]) and not args.json:
+        count_and_optionally_output_tokens(
+            args.file_paths[0],
+            args.model,
+            args.output_tokens,
+            args.no_special_tokens,
+            stream=args.stream,
+            chunk_size=max(args.chunk_size, 1),
+            jobs=jobs,
+            cache=cache,
+            server=args.client
+        )
+        sys.exit(0)
+
+    file_paths, unmatched = collect_files(args.file_paths, show_hidden=args.hidden)
+    for item in unmatched:
+        print(f"Warning: No files match '{item}'", file=sys.stderr)
+    if not file_paths:
+        print("Error: No files to count.", file=sys.stderr)
         sys.exit(1)
 
-    count_and_optionally_output_tokens(
-        args.file_path,
-        args.model,
-        args.output_tokens,
-        args.no_special_tokens
-    )
+    if args.client:
+        results, tokenizer = count_on_server(args.client, args.model, file_paths, args.no_special_tokens,
+                                             args.output_tokens), None
+    else:
+        results, tokenizer = run_count(args.model, file_paths, args.no_special_tokens, jobs,
+                                       batch_size=max(args.batch_size, 1), keep_ids=args.output_tokens,
+                                       stream=args.stream, chunk_size=max(args.chunk_size, 1), cache=cache)
+
+    if args.output_tokens and not args.json:
+        for r in results:
+            if 'tokens' in r:
+                print(f"--- Tokens: {r['path']} ---")
+                print_tokens(tokenizer, r)
 
+    print_report(results, args.model, args.no_special_tokens, as_json=args.json)